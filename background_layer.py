@@ -0,0 +1,116 @@
+import pygame
+
+from map import *
+from camera import Camera
+from frame_profiler import profiler
+
+
+class Background_layer:
+    # Off-screen, pre-rendered picture of the static part of the map as seen through the camera: the grid, tracks, switches, stations and the base station.
+    # The game blits it instead of redrawing all of it every frame. It listens to the map changes (editor actions, switch toggles)
+    #     and re-renders only the tiles which changed. When the camera pans, the picture is scrolled and only the uncovered strips are rendered;
+    #     only a zoom change renders the whole view again. Either way only the tiles inside the view are drawn, however large the map.
+    def __init__(self, map:Map, camera:Camera):
+        self.camera = camera
+        self.surface = pygame.Surface(camera.view_rect.size)
+        self.map = None
+        self.dirty_tiles = set()
+        self.rendered_view = None  # the camera state the surface shows
+        # Surface for re-rendering parts of the view, larger than it by a margin so that the elements near the view edges are drawn whole:
+        #     pygame rasterizes clipped thick diagonal lines slightly differently, so they would not match once scrolled into view.
+        self.margin = ELEMENT_SIZE * 2
+        self.scratch = None
+        self.set_map(map)
+
+    def set_map(self, map:Map):
+        if self.map: self.map.remove_change_listener(self.invalidate)
+        self.map = map
+        map.add_change_listener(self.invalidate)
+        self.render_all()
+
+    def invalidate(self, tile_x, tile_y):
+        self.dirty_tiles.add((tile_x, tile_y))
+
+    def render_all(self):
+        self.dirty_tiles.clear()
+        self.rendered_view = self.camera.state
+        self.render_region(self.surface.get_rect())
+
+    def draw_map(self, surface, tiles_x:range, tiles_y:range, offset):
+        # Full detail drawing of the given tiles, with the map moved by offset on the surface.
+        surface.fill(BACKGROUND_COLOR)
+        # Draw grid lines
+        map_width, map_height = self.map.width * ELEMENT_SIZE, self.map.height * ELEMENT_SIZE
+        with profiler.phase('grid'):
+            for x in range(tiles_x.start * ELEMENT_SIZE, tiles_x.stop * ELEMENT_SIZE + 1, ELEMENT_SIZE):
+                pygame.draw.line(surface, pygame.Color('black'), (x + offset[0], offset[1]), (x + offset[0], map_height + offset[1]), 1)
+            for y in range(tiles_y.start * ELEMENT_SIZE, tiles_y.stop * ELEMENT_SIZE + 1, ELEMENT_SIZE):
+                pygame.draw.line(surface, pygame.Color('black'), (offset[0], y + offset[1]), (map_width + offset[0], y + offset[1]), 1)
+        # same drawing order as a full redraw, so the overlaps look the same:
+        drawn = 0
+        with profiler.phase('elements'):
+            for tile_x in tiles_x:
+                for tile_y in tiles_y:
+                    element = self.map.map_elements.get(tile_x, tile_y)
+                    if element is not None:
+                        element.draw(surface, offset)
+                        drawn += 1
+        profiler.count_draws(len(tiles_x) + len(tiles_y) + 2 + drawn)  # the grid lines and the elements
+
+    def draw_map_lod(self, surface, tiles_x:range, tiles_y:range, offset):
+        # Zoomed out drawing: no grid and no labels, the elements reduced to lines and boxes, visiting only the occupied tiles.
+        surface.fill(BACKGROUND_COLOR)
+        map_corner = Map_element.shifted(self.camera.world_to_view(0, 0), offset)
+        pygame.draw.rect(surface, pygame.Color('black'), (map_corner, (self.map.width * ELEMENT_SIZE * self.camera.zoom, self.map.height * ELEMENT_SIZE * self.camera.zoom)), 1)
+        drawn = 0
+        with profiler.phase('elements'):
+            for _, _, element in self.map.map_elements.items_in(tiles_x, tiles_y):
+                element.draw_lod(surface, self.camera, offset)
+                drawn += 1
+        profiler.count_draws(1 + drawn)
+
+    def render_region(self, rect:pygame.Rect):
+        # Redraws the given rect of the view, with the elements of the tiles overlapping it and their neighbors
+        #     (elements draw over their own tile and a bit over the neighbor ones, e.g. the roof of stations, the versor labels).
+        tiles_x, tiles_y = self.camera.tiles_in(rect, margin=1)
+        if self.scratch is None: self.scratch = pygame.Surface((self.surface.get_width() + 2 * self.margin, self.surface.get_height() + 2 * self.margin))
+        scratch_rect = rect.move(self.margin, self.margin)
+        self.scratch.set_clip(scratch_rect.inflate(ELEMENT_SIZE * 4, ELEMENT_SIZE * 4))  # generous clip, only to not fill the whole scratch surface
+        if self.camera.is_detailed:
+            self.draw_map(self.scratch, tiles_x, tiles_y, (self.margin - self.camera.offset_x, self.margin - self.camera.offset_y))
+        else:
+            self.draw_map_lod(self.scratch, tiles_x, tiles_y, (self.margin, self.margin))
+        self.surface.blit(self.scratch, rect, scratch_rect)
+
+    def scroll(self, dx:int, dy:int):
+        # moves the picture with the camera and renders the uncovered strips
+        self.surface.scroll(dx, dy)
+        width, height = self.surface.get_size()
+        if dx > 0: self.render_region(pygame.Rect(0, 0, dx, height))
+        if dx < 0: self.render_region(pygame.Rect(width + dx, 0, -dx, height))
+        if dy > 0: self.render_region(pygame.Rect(0, 0, width, dy))
+        if dy < 0: self.render_region(pygame.Rect(0, height + dy, width, -dy))
+
+    def update(self) -> list:
+        """Bring the picture up to date with the camera and the map changes. Returns the rects (in view coordinates) which need to be updated on screen."""
+        camera = self.camera
+        changed_rects = []
+        if camera.state != self.rendered_view:
+            old_x, old_y, old_zoom = self.rendered_view
+            dx, dy = (old_x - camera.offset_x) * camera.zoom, (old_y - camera.offset_y) * camera.zoom
+            if (old_zoom == camera.zoom and dx == int(dx) and dy == int(dy)
+                    and abs(dx) < self.surface.get_width() and abs(dy) < self.surface.get_height()):
+                self.scroll(int(dx), int(dy))
+                self.rendered_view = camera.state
+            else:
+                self.render_all()
+            changed_rects.append(self.surface.get_rect())
+
+        tiles_x, tiles_y = camera.visible_tiles()
+        for tile_x, tile_y in self.dirty_tiles:
+            if tile_x in tiles_x and tile_y in tiles_y:
+                rect = camera.tile_rect(tile_x, tile_y).clip(self.surface.get_rect())
+                self.render_region(rect)
+                changed_rects.append(rect)
+        self.dirty_tiles.clear()
+        return changed_rects
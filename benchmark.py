@@ -0,0 +1,173 @@
+import os
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')  # headless: no window is shown, everything is drawn to memory only
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+import argparse
+import json
+import random
+import sys
+import tempfile
+import time
+
+from map import *
+from simulation import Simulation
+import map_io
+from edit_journal import Edit_journal
+from map_generator import generate_map
+
+# Benchmarks of the hot paths of the game, on synthetic maps of a given size, switch density and train count:
+#     python benchmark.py [--size 100] [--switch-density 0.5] [--trains 200]
+# Each path is timed a few times and the best run is kept, reported as a throughput (higher is better) and compared with the stored baseline
+#     (BASELINE_FILE, made on the same parameters with --save-baseline). With --check the exit code is 1 if any path got slower than the tolerance,
+#     so it can run before a release. The baseline is machine specific, so it is not in the repository (it's in .gitignore): make one on the machine
+#     the checks run on with `python benchmark.py --save-baseline` (same parameters as the checks), then run `python benchmark.py --check` there.
+BASELINE_FILE = "benchmark_baseline.json"
+REGRESSION_TOLERANCE = 0.8  # a path is reported as a regression when it runs at less than this fraction of its baseline throughput
+REPEATS = 5
+
+
+def synthetic_map(args) -> Map:
+    # a generated map of args.size x args.size tiles, with args.switch_density switches per 100 tiles (a generated map has one switch less than stations)
+    return generate_map(args.size, args.size, stations=1 + round(args.switch_density * args.size * args.size / 100), seed=0)
+
+
+def spawn_trains(simulation:Simulation, count:int, seed:int=0):
+    # trains already en route, spread over the tracks, so they don't all travel the same tiles
+    rng = random.Random(seed)
+    tracks = [element for element in simulation.map.map_elements.values() if isinstance(element, (Track_segment, Switch))]
+    colors = [station.color for station in simulation.map.stations]
+    for _ in range(count):
+        simulation.train_store.spawn(rng.choice(colors), rng.choice(tracks), Train_status.EN_ROUTE)
+
+
+def best_time(function, setup=None, repeats:int=REPEATS) -> float:
+    # the best of a few runs, the others being slowed down by whatever else the machine did meanwhile
+    # setup: makes what the function runs on, afresh for each run and not timed, e.g. a simulation to advance
+    times = []
+    for _ in range(repeats):
+        argument = setup() if setup else None
+        start = time.perf_counter()
+        function(argument) if setup else function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def bench_advance(args) -> dict:
+    # the simulation ticks, with the given number of trains moving
+    map = synthetic_map(args)
+    def setup():
+        simulation = Simulation(map)
+        spawn_trains(simulation, args.trains)
+        return simulation
+    def run(simulation):
+        for _ in range(args.ticks):
+            simulation.train_store.advance()
+    return {'advance': ('ticks/s', args.ticks / best_time(run, setup))}
+
+
+def bench_draw(args) -> dict:
+    # the frames drawn while the game runs (only the changes redrawn), and the full redraws (e.g. after a camera zoom)
+    from game import Game
+    with tempfile.TemporaryDirectory() as directory:
+        game = Game(journal=Edit_journal(os.path.join(directory, AUTOSAVE_SNAPSHOT_FILE), os.path.join(directory, AUTOSAVE_JOURNAL_FILE)))
+        game.map = synthetic_map(args)
+        game.start_game()
+        spawn_trains(game.simulation, args.trains)
+        game.draw()
+        def frames(full_redraw:bool):
+            for _ in range(args.frames):
+                game.simulation.train_store.advance()
+                game.full_redraw_needed = full_redraw
+                game.draw()
+        results = {'draw': ('frames/s', args.frames / best_time(lambda: frames(False))),
+                   'draw_full': ('frames/s', args.frames / best_time(lambda: frames(True)))}
+        game.journal.close()
+    return results
+
+
+def bench_track_drag(args) -> dict:
+    # laying tracks by dragging, one tile per mouse motion, row after row
+    def lay():
+        map = Map(args.size, args.size)
+        for tile_y in range(0, args.size, 2):
+            map.set_click_location(0, tile_y)
+            map.add_track_by_click()
+            for tile_x in range(1, args.size):
+                map.add_track_drag(tile_x, tile_y)
+            map.finish_track_drag()
+    tiles = (args.size + 1) // 2 * args.size
+    return {'add_track_drag': ('tiles/s', tiles / best_time(lay))}
+
+
+def bench_get_neighbor(args) -> dict:
+    # the neighbor lookups of the editor, on every occupied tile, both ways
+    map = synthetic_map(args)
+    tiles = [(tile_x, tile_y) for tile_x, tile_y, _ in map.map_elements.items()]
+    def lookup():
+        for tile_x, tile_y in tiles:
+            map.get_neighbor(tile_x, tile_y, UPSTREAM)
+            map.get_neighbor(tile_x, tile_y, DOWNSTREAM)
+    return {'get_neighbor': ('calls/s', 2 * len(tiles) / best_time(lookup))}
+
+
+def bench_save_load(args) -> dict:
+    map = synthetic_map(args)
+    tiles = len(map.map_elements)
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "map" + map_io.MAP_FILE_EXTENSION)
+        save_time = best_time(lambda: map_io.save_map(map, filename))
+        load_time = best_time(lambda: map_io.load_map(filename))
+    return {'save_map': ('tiles/s', tiles / save_time), 'load_map': ('tiles/s', tiles / load_time)}
+
+
+BENCHMARKS = {'advance': bench_advance, 'draw': bench_draw, 'track_drag': bench_track_drag, 'get_neighbor': bench_get_neighbor, 'save_load': bench_save_load}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmarks of the game hot paths, on synthetic maps")
+    parser.add_argument('--size', type=int, default=100, help="map width and height, in tiles")
+    parser.add_argument('--switch-density', type=float, default=0.5, help="switches per 100 tiles of the map")
+    parser.add_argument('--trains', type=int, default=200, help="trains moving during the advance and draw benchmarks")
+    parser.add_argument('--ticks', type=int, default=500, help="simulation ticks per advance run")
+    parser.add_argument('--frames', type=int, default=100, help="frames per draw run")
+    parser.add_argument('--only', nargs='+', choices=sorted(BENCHMARKS), help="run only these benchmarks")
+    parser.add_argument('--baseline', default=BASELINE_FILE, help="baseline file to compare with")
+    parser.add_argument('--save-baseline', action='store_true', help="store the results as the new baseline")
+    parser.add_argument('--check', action='store_true', help="exit with code 1 if any path regressed against the baseline")
+    args = parser.parse_args(argv)
+    configure_logging()
+    parameters = {'size': args.size, 'switch_density': args.switch_density, 'trains': args.trains, 'ticks': args.ticks, 'frames': args.frames}
+
+    results = {}
+    for name, benchmark in BENCHMARKS.items():
+        if args.only is None or name in args.only:
+            results.update(benchmark(args))
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            stored = json.load(f)
+        if stored.get('parameters') == parameters: baseline = stored['results']
+        else: print(f"The baseline in {args.baseline} was made with other parameters ({stored.get('parameters')}), not compared")
+    elif not args.save_baseline:
+        print(f"No baseline in {args.baseline}, not compared (make one on this machine with --save-baseline)")
+    regressions = []
+    print(f"{'path':<16}{'throughput':>16}  {'unit':<10}{'baseline':>8}")
+    for path, (unit, throughput) in results.items():
+        comparison = ''
+        if path in baseline:
+            ratio = throughput / baseline[path]
+            comparison = f"{ratio:>7.2f}x"
+            if ratio < REGRESSION_TOLERANCE:
+                comparison += "  REGRESSION"
+                regressions.append(path)
+        print(f"{path:<16}{throughput:>16.1f}  {unit:<10}{comparison}")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({'parameters': parameters, 'results': {path: round(throughput, 1) for path, (unit, throughput) in results.items()}}, f, indent=4)
+        print(f"Baseline saved to {args.baseline}")
+    return 1 if args.check and regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+import math
+import pygame
+
+from game_config import *
+
+
+class Camera:
+    # Maps the map ("world") pixel coordinates, where the elements and the trains live, to the screen, so the map can be larger than the window.
+    # The view shows the world from (offset_x, offset_y) on, scaled by zoom. The zoom goes in steps (ZOOM_LEVELS), the elements being drawn in full detail
+    #     only at zoom 1 (their natural size), and with a cheap level of detail when zoomed out (see is_detailed).
+    # The offsets are whole world pixels, so that at zoom 1 the view is an exact translation of the world and panning can scroll the already drawn picture.
+    def __init__(self, view_rect:pygame.Rect):
+        self.view_rect = view_rect  # the part of the screen showing the map
+        self.zoom = 1
+        self.offset_x = 0  # world coordinates shown in the top left corner of the view
+        self.offset_y = 0
+        self.map_width = MAP_WIDTH  # in tiles, for keeping the view over the map
+        self.map_height = MAP_HEIGHT
+
+    def set_map(self, map):
+        """Follow a new map: show its top left corner."""
+        self.map_width, self.map_height = map.width, map.height
+        self.offset_x = self.offset_y = 0
+        self.clamp()
+
+    @property
+    def is_detailed(self) -> bool:
+        """False when zoomed out: the map is then drawn as plain lines and boxes and the trains as dots."""
+        return self.zoom >= 1
+
+    @property
+    def state(self) -> tuple:
+        return (self.offset_x, self.offset_y, self.zoom)
+
+    def world_to_view(self, x, y):
+        """Coordinates relative to the view's top left corner (works on NumPy arrays too)."""
+        return (x - self.offset_x) * self.zoom, (y - self.offset_y) * self.zoom
+
+    def world_to_screen(self, x, y):
+        view_x, view_y = self.world_to_view(x, y)
+        return view_x + self.view_rect.x, view_y + self.view_rect.y
+
+    def screen_to_world(self, screen_x, screen_y):
+        return ((screen_x - self.view_rect.x) / self.zoom + self.offset_x,
+                (screen_y - self.view_rect.y) / self.zoom + self.offset_y)
+
+    def screen_to_tile(self, screen_x, screen_y) -> tuple[int, int]:
+        world_x, world_y = self.screen_to_world(screen_x, screen_y)
+        # -1 as the grid line at the right/bottom of a tile belongs to it:
+        return math.floor((world_x - 1) / ELEMENT_SIZE), math.floor((world_y - 1) / ELEMENT_SIZE)
+
+    def tile_rect(self, tile_x:int, tile_y:int) -> pygame.Rect:
+        """The rect covered by the tile, in view coordinates (with the grid line below it for the last row)."""
+        left, top = self.world_to_view(tile_x * ELEMENT_SIZE, tile_y * ELEMENT_SIZE)
+        right, bottom = self.world_to_view((tile_x + 1) * ELEMENT_SIZE, (tile_y + 1) * ELEMENT_SIZE)
+        if tile_y == self.map_height - 1: bottom += 1
+        return pygame.Rect(math.floor(left), math.floor(top), math.ceil(right) - math.floor(left), math.ceil(bottom) - math.floor(top))
+
+    def tiles_in(self, rect:pygame.Rect, margin:int=0) -> tuple[range, range]:
+        """The tiles of the map overlapping the given rect (in view coordinates), plus margin tiles around."""
+        left, top = self.offset_x + rect.left / self.zoom, self.offset_y + rect.top / self.zoom
+        right, bottom = self.offset_x + rect.right / self.zoom, self.offset_y + rect.bottom / self.zoom
+        return (range(max(0, math.floor(left / ELEMENT_SIZE) - margin), min(self.map_width, math.floor(right / ELEMENT_SIZE) + 1 + margin)),
+                range(max(0, math.floor(top / ELEMENT_SIZE) - margin), min(self.map_height, math.floor(bottom / ELEMENT_SIZE) + 1 + margin)))
+
+    def visible_tiles(self) -> tuple[range, range]:
+        return self.tiles_in(pygame.Rect((0, 0), self.view_rect.size))
+
+    def clamp(self):
+        # Keep the map in view: no scrolling past its right/bottom edges, and none at all along a dimension where it fits in the view.
+        max_x = self.map_width * ELEMENT_SIZE - int(self.view_rect.width / self.zoom)
+        max_y = self.map_height * ELEMENT_SIZE + 1 - int(self.view_rect.height / self.zoom)
+        self.offset_x = max(0, min(self.offset_x, max_x))
+        self.offset_y = max(0, min(self.offset_y, max_y))
+
+    def pan(self, screen_dx:int, screen_dy:int):
+        """Move the map by the given amount of screen pixels (e.g. the mouse movement while dragging it)."""
+        self.offset_x -= round(screen_dx / self.zoom)
+        self.offset_y -= round(screen_dy / self.zoom)
+        self.clamp()
+
+    def zoom_at(self, steps:int, screen_x, screen_y):
+        """Zoom in (steps > 0) or out by the given number of ZOOM_LEVELS, keeping the world point under (screen_x, screen_y) in place."""
+        level = ZOOM_LEVELS.index(self.zoom) + steps
+        zoom = ZOOM_LEVELS[max(0, min(len(ZOOM_LEVELS) - 1, level))]
+        if zoom == self.zoom: return
+        world_x, world_y = self.screen_to_world(screen_x, screen_y)
+        self.zoom = zoom
+        self.offset_x = round(world_x - (screen_x - self.view_rect.x) / zoom)
+        self.offset_y = round(world_y - (screen_y - self.view_rect.y) / zoom)
+        self.clamp()
@@ -0,0 +1,193 @@
+import asyncio
+import concurrent.futures
+import json
+import os
+import queue
+import threading
+
+from map import *
+import map_io
+
+
+class Autosave_failed(Exception):
+    # the autosave stopped working, so its copy of the map can't be trusted (it may miss edits, or even be the previous map)
+    pass
+
+
+class Edit_journal:
+    # Autosave of the map being edited, cheap enough to run after every single edit:
+    #     the editor operations recorded by the map (see Map.record_edit) are appended, one JSON line each, to the journal file,
+    #     so saving costs in proportion to the edit, not to the map. From time to time the journal is compacted: the whole map is written
+    #     to the snapshot file (a regular map file, see map_io) and the journal starts over empty.
+    # All the disk work happens on a background thread, the game only puts the records in a queue, so the frame loop never waits for the disk.
+    # The thread keeps its own copy of the map, rebuilt by replaying the records on it, and writes the snapshots from that copy,
+    #     so it never reads the map the game is editing meanwhile.
+    # The snapshots don't hold the state of a track drag in progress (the chain being laid), so there is no compaction while a drag is open,
+    #     from its 'track' record to its 'drag_end': the records of the drag stay in the journal, to be replayed on a map without the drag.
+    # After a crash, recover() rebuilds the map from the snapshot and the records journaled after it. After a normal exit there is nothing to recover:
+    #     close() marks the final snapshot as a clean shutdown, and the next start begins with whatever map the player opens.
+    #     (In the browser the game is never closed, it's just left, so there the map is always restored.)
+    # Where there are no threads (in the browser), the same work is done by an asyncio task of the game loop instead, see run_async.
+    def __init__(self, snapshot_filename:str=AUTOSAVE_SNAPSHOT_FILE, journal_filename:str=AUTOSAVE_JOURNAL_FILE, compact_every:int=AUTOSAVE_COMPACT_EVERY):
+        self.snapshot_filename = snapshot_filename
+        self.journal_filename = journal_filename
+        self.compact_every = compact_every  # edits journaled between two snapshots
+        self.map = None  # the map being journaled
+        self.queue = queue.Queue()
+        self.thread = None
+        # owned by the background thread:
+        self.shadow_map = None  # copy of the map as of the last record written
+        self.journal_file = None
+        self.sequence = 0  # number of the last record written, the snapshots remember up to which record they include
+        self.edits_since_snapshot = 0
+        self.failed = False
+        self.recovery_errors = []  # the journaled edits which recover() could not replay, as messages for the player
+
+    def start(self, map:Map, data:dict=None):
+        """Journal the edits of the given map (a new or loaded one), instead of those of the previous map. Its current state is snapshotted right away.
+        data: the map as plain data (see map_io.map_to_data), if already at hand, e.g. just read from a file."""
+        if self.map: self.map.remove_edit_listener(self.record)
+        self.map = map
+        map.add_edit_listener(self.record)
+        self.queue.put(('reset', data if data is not None else map_io.map_to_data(map)))  # as plain data, which the thread can read while the game goes on editing the map
+        if self.thread is None and THREADS_AVAILABLE:
+            self.thread = threading.Thread(target=self.run, name="autosave", daemon=True)
+            self.thread.start()
+
+    def record(self, edit:dict):
+        self.queue.put(('edit', edit))
+
+    def save_copy(self, filename:str) -> concurrent.futures.Future:
+        """Write the map, as of the last edit recorded, to another file (a regular map file), e.g. for the Save button.
+        Written in the background from the copy of the map, so the game doesn't wait for it: the returned future completes when it's done.
+        If the autosave has failed, the future fails with Autosave_failed, nothing being written: the copy may not be the map the player sees."""
+        future = concurrent.futures.Future()
+        self.queue.put(('save', (filename, future)))
+        return future
+
+    def close(self):
+        """Write the pending records and a final snapshot (so the next start doesn't need to replay anything), and stop the thread."""
+        if self.map: self.map.remove_edit_listener(self.record)
+        self.map = None
+        if self.thread:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+        else:
+            self.process(self.drain() + [None])
+
+    async def run_async(self):
+        # The background work without a thread: the queued items are processed one at a time, the game loop running in between.
+        while True:
+            items = self.drain()
+            for item in items:
+                self.process([item])
+                await asyncio.sleep(0)
+            if not items: await asyncio.sleep(IDLE_POLL_INTERVAL)
+
+    def drain(self) -> list:
+        items = []
+        while True:
+            try:
+                items.append(self.queue.get_nowait())
+            except queue.Empty:
+                return items
+
+    def run(self):
+        while True:
+            items = [self.queue.get()] + self.drain()  # waits for the next record, then takes all the ones queued meanwhile
+            self.process(items)
+            if items[-1] is None: return
+
+    def process(self, items:list):
+        for item in items:
+            if item is None:  # closing
+                self.safely(self.close_files)
+                return
+            kind, content = item
+            if kind == 'reset':
+                self.safely(self.reset, content)
+            elif kind == 'save':
+                filename, future = content
+                try:
+                    if self.failed: raise Autosave_failed("The autosave failed, its copy of the map may be outdated")
+                    map_io.save_map(self.shadow_map, filename)
+                    future.set_result(filename)
+                except Exception as e:  # reported to the one who asked for the save, the autosave is not affected
+                    future.set_exception(e)
+            else:
+                self.safely(self.write_record, content)
+        # one flush per batch of records: on disk before the next batch, whatever happens to the game
+        self.safely(self.flush)
+
+    def safely(self, step, *args):
+        # the autosave is a safety net only: if it fails (e.g. disk full) the game goes on, without it
+        try:
+            step(*args)
+        except Exception as e:
+            if not self.failed: game_logger.error("Autosave failed: %s", e)
+            self.failed = True
+
+    def reset(self, data:dict):
+        self.shadow_map = map_io.map_from_data(data)
+        self.compact()
+
+    def write_record(self, edit:dict):
+        self.sequence += 1
+        self.shadow_map.apply_edit(edit)
+        self.journal_file.write(json.dumps({'seq': self.sequence, **edit}, default=map_io.color_to_hex, separators=(',', ':')) + '\n')
+        self.edits_since_snapshot += 1
+
+    def flush(self):
+        if self.journal_file:
+            self.journal_file.flush()
+            os.fsync(self.journal_file.fileno())
+        if self.edits_since_snapshot >= self.compact_every and self.shadow_map.previous_track_tile_position is None: self.compact()  # not in the middle of a drag
+
+    def close_files(self):
+        if self.shadow_map is not None: self.compact(clean_shutdown=True)
+        if self.journal_file: self.journal_file.close()
+        self.journal_file = None
+
+    def compact(self, clean_shutdown:bool=False):
+        # The snapshot replaces the previous one atomically, then the journal is emptied. Crashing in between is fine:
+        #     the records left in the journal are already in the snapshot, and the replay skips them by their sequence numbers.
+        map_io.save_map(self.shadow_map, self.snapshot_filename, journal_sequence=self.sequence, clean_shutdown=clean_shutdown)
+        if self.journal_file is None: self.journal_file = open(self.journal_filename, 'a', newline='\n')
+        self.journal_file.seek(0)
+        self.journal_file.truncate()
+        self.journal_file.flush()
+        os.fsync(self.journal_file.fileno())
+        self.edits_since_snapshot = 0
+
+    def recover(self) -> Map:
+        """The map as it was at the last journaled edit, if the game didn't close normally, None otherwise (or if there is no autosave).
+        Raises ValueError if the snapshot is unreadable.
+        If an edit can't be replayed, the map stays as of the edit before, and the edits lost are listed in recovery_errors."""
+        self.recovery_errors = []
+        if not os.path.exists(self.snapshot_filename): return None
+        with open(self.snapshot_filename, 'rb') as f:
+            data = json.loads(f.read())
+        if data.get('clean_shutdown'): return None  # nothing was lost
+        map = map_io.map_from_data(data)
+        self.sequence = data.get('journal_sequence', 0)
+        if os.path.exists(self.journal_filename):
+            with open(self.journal_filename, 'r') as f:
+                lines = f.readlines()
+            for number, line in enumerate(lines):
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    if number == len(lines) - 1 and not line.endswith('\n'): break  # the last line, half written when the game stopped: never flushed, so never saved
+                    self.recovery_errors.append(f"Unreadable autosave record, {len(lines) - number} edits lost")
+                    break
+                try:
+                    if record['seq'] <= self.sequence: continue  # already in the snapshot
+                    map.apply_edit(record)
+                except (ValueError, KeyError, TypeError, AttributeError, IndexError) as e:
+                    # the edits after it were made on a map which had it, so they can't be replayed either:
+                    self.recovery_errors.append(f"Autosaved edit {number + 1} could not be replayed ({e}), {len(lines) - number} edits lost")
+                    break
+                self.sequence = record['seq']
+        for error in self.recovery_errors: game_logger.warning(error)
+        return map
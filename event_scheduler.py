@@ -0,0 +1,106 @@
+import heapq
+import numpy as np
+
+from simulation import *
+from map_elements.train_store import EN_ROUTE, IN_BASE
+
+
+class Event_scheduler:
+    # Event-driven mode for running a Simulation headlessly, much faster than frame by frame.
+    # Most ticks change nothing important: every moving train gets TRAIN_SPEED further along its tile and the spawn timer counts down.
+    # So we keep a priority queue of the future events (a train reaching the end of its tile - which is also how it reaches a station or gets stranded -
+    #     and switch toggles), plus the tick at which the next train spawns, and jump straight from one event to the next,
+    #     applying the quiet ticks in between in bulk.
+    # Ticks where something happens are run with the normal Simulation.update(), so the results are exactly those of the frame-stepped mode.
+    TRAIN_LEAVES = 0
+    TOGGLE_SWITCH = 1
+
+    def __init__(self, simulation:Simulation):
+        self.simulation = simulation
+        self.queue = []  # heap of (tick, kind, sequence number, payload)
+        self.sequence = 0  # keeps the ordering stable between events of the same tick
+        self.train_versions = np.zeros(0, dtype=np.int64)  # events of a train whose version changed meanwhile are stale and skipped
+
+    def push(self, tick, kind, payload):
+        heapq.heappush(self.queue, (tick, kind, self.sequence, payload))
+        self.sequence += 1
+
+    def schedule_toggle(self, tick:int, switch:Switch):
+        """Toggle the switch just before the given tick is simulated (like a click handled before Game.update_map)."""
+        self.push(tick, Event_scheduler.TOGGLE_SWITCH, switch)
+
+    def schedule_trains(self, indexes):
+        # Pushes, for the given trains, the tick at which they leave their current tile (evaluated at the current tick, before its update).
+        simulation = self.simulation
+        store, graph, tick = simulation.train_store, simulation.track_graph, simulation.tick_count
+        self.train_versions = Utils.grow(self.train_versions, store.count)
+        for index in indexes:
+            self.train_versions[index] += 1
+            if store.status[index] not in (EN_ROUTE, IN_BASE): continue
+            node = store.node[index]
+            if graph.is_stalled(node):  # strands right away
+                remaining_moves = 0
+            else:  # moves while a further step keeps it on the tile
+                remaining_moves = max(0, int((graph.length[node] - store.distance[index]) // TRAIN_SPEED))
+            self.push(tick + remaining_moves, Event_scheduler.TRAIN_LEAVES, (index, self.train_versions[index]))
+
+    def reschedule_all(self):
+        self.queue = [event for event in self.queue if event[1] != Event_scheduler.TRAIN_LEAVES]
+        heapq.heapify(self.queue)
+        self.schedule_trains(range(self.simulation.train_store.count))
+
+    def next_spawn_tick(self):
+        simulation = self.simulation
+        # while the map is too loaded nothing spawns - until a train leaves the tracks, which is an event anyway:
+        if simulation.train_store.count_status(Train_status.EN_ROUTE) >= MAX_TRAINS_EN_ROUTE: return None
+        return simulation.tick_count + max(0, simulation.time_to_next_train_spawn)
+
+    def next_event_tick(self):
+        # drop the events made stale meanwhile:
+        while self.queue and self.queue[0][1] == Event_scheduler.TRAIN_LEAVES:
+            index, version = self.queue[0][3]
+            if self.train_versions[index] == version: break
+            heapq.heappop(self.queue)
+        return self.queue[0][0] if self.queue else None
+
+    def run(self, ticks:int):
+        """Advance the simulation by the given number of ticks, ending in exactly the same state as calling Simulation.update() that many times."""
+        simulation = self.simulation
+        store = simulation.train_store
+        end_tick = simulation.tick_count + ticks
+        # the simulation may have been advanced or edited by other means since the last run, so the trains are scheduled from scratch:
+        simulation.track_graph.sync()
+        self.reschedule_all()
+
+        while simulation.tick_count < end_tick:
+            event_ticks = [tick for tick in (self.next_event_tick(), self.next_spawn_tick()) if tick is not None]
+            next_tick = max(simulation.tick_count, min(event_ticks + [end_tick]))  # toggles scheduled in the past are done right away
+
+            # Quiet ticks: every moving train does a full step per tick and the spawn timer counts down:
+            quiet_ticks = next_tick - simulation.tick_count
+            if quiet_ticks > 0:
+                n = store.count
+                status = store.status[:n]
+                store.distance[:n][(status == EN_ROUTE) | (status == IN_BASE)] += TRAIN_SPEED * quiet_ticks
+                simulation.time_to_next_train_spawn -= quiet_ticks
+                simulation.tick_count = next_tick
+            if next_tick == end_tick: break
+
+            # An eventful tick: apply the toggles due now, then run the regular update, then reschedule the trains it touched.
+            touched = set()
+            while self.queue and self.queue[0][0] <= next_tick:
+                _, kind, _, payload = heapq.heappop(self.queue)
+                if kind == Event_scheduler.TOGGLE_SWITCH:
+                    simulation.toggle_switch(payload)
+                    simulation.track_graph.sync()
+                    switch_node = simulation.track_graph.ids.get(payload)
+                    touched.update(np.flatnonzero(store.node[:store.count] == switch_node).tolist())
+                else:
+                    index, version = payload
+                    if self.train_versions[index] == version: touched.add(index)
+            count_before, compactions = store.count, store.compactions
+            simulation.update()
+            if store.compactions != compactions:  # trains were retired, the rows of the others moved
+                self.reschedule_all()
+            else:
+                self.schedule_trains(sorted(touched) + list(range(count_before, store.count)))
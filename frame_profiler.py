@@ -0,0 +1,130 @@
+import csv
+import json
+import time
+import numpy as np
+import pygame
+
+from game_config import *
+from resources import resources
+
+# The phases of a frame which are timed: the top level ones, called by the game loop, and the parts of drawing.
+#     "grid" and "elements" are the background layer re-rendering (only the tiles which changed, so often nothing),
+#     "buttons" the toolbar, "flip" sending the changed rects to the display. "tick" is mostly the wait capping the frame rate.
+PHASES = ('handle_events', 'update', 'draw', 'grid', 'elements', 'trains', 'buttons', 'flip', 'tick')
+TOP_PHASES = ('handle_events', 'update', 'draw')  # the work of a frame, the other phases are parts of these, except tick
+COLUMNS = ('frame',) + PHASES + ('trains_alive', 'draw_calls')  # one row per frame, times in milliseconds
+
+
+class Phase_timer:
+    # Context manager adding the time spent inside it to one column of the current frame.
+    def __init__(self, profiler, column:int):
+        self.profiler = profiler
+        self.column = column
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.profiler.current[self.column] += (time.perf_counter() - self.start) * 1000
+
+
+class No_timer:
+    # What the profiler hands out when disabled: entering and leaving it does nothing.
+    def __enter__(self): pass
+    def __exit__(self, *exc): pass
+
+
+NO_TIMER = No_timer()
+
+
+class Frame_profiler:
+    # Measures where the time of each frame goes, e.g. to find regressions on slow devices:
+    #     the code to measure is wrapped in "with profiler.phase('name'):", and the time is added to that phase of the current frame.
+    # The last PROFILER_FRAMES frames are kept in a ring buffer (a NumPy array, one row per frame, see COLUMNS),
+    #     shown summarized in an on-screen overlay (F3), and written to PROFILER_TRACE_FILE .csv and .json when the game exits.
+    # Disabled (the default, enabled by TRAINS_PROFILE=1 or by showing the overlay), phase() returns a shared do-nothing context manager
+    #     and the frame calls return right away, so the instrumented code runs at practically the same speed.
+    def __init__(self, capacity:int=PROFILER_FRAMES):
+        self.enabled = False
+        self.show_overlay = False
+        self.frames = np.zeros((capacity, len(COLUMNS)))
+        self.frame_count = 0  # frames recorded since enabled, the last ones are in the ring buffer
+        self.current = np.zeros(len(COLUMNS))
+        self.frame_start = None
+        self.timers = {name: Phase_timer(self, COLUMNS.index(name)) for name in PHASES}
+
+    def enable(self):
+        if not self.enabled:
+            self.enabled = True
+            self.frame_count = 0
+            self.frame_start = None
+
+    def phase(self, name:str):
+        return self.timers[name] if self.enabled else NO_TIMER
+
+    def count_draws(self, draws:int):
+        # draw calls made for the current frame (blits and shapes drawn)
+        if self.enabled: self.current[COLUMNS.index('draw_calls')] += draws
+
+    def start_frame(self):
+        if not self.enabled: return
+        self.current[:] = 0
+        self.frame_start = time.perf_counter()
+
+    def end_frame(self, trains_alive:int=0):
+        if not self.enabled or self.frame_start is None: return
+        self.current[0] = (time.perf_counter() - self.frame_start) * 1000
+        self.current[COLUMNS.index('trains_alive')] = trains_alive
+        self.frames[self.frame_count % len(self.frames)] = self.current
+        self.frame_count += 1
+        self.frame_start = None
+
+    def recent_frames(self) -> np.ndarray:
+        """The frames in the ring buffer, oldest first."""
+        capacity = len(self.frames)
+        if self.frame_count <= capacity: return self.frames[:self.frame_count]
+        return np.roll(self.frames, -(self.frame_count % capacity), axis=0)
+
+    def summary(self) -> dict:
+        """Percentiles of the recent frames: p50 and p99 of the frame time and of the time spent working (without the wait of tick), in milliseconds."""
+        frames = self.recent_frames()
+        if len(frames) == 0: return {}
+        work = frames[:, [COLUMNS.index(name) for name in TOP_PHASES]].sum(axis=1)
+        frame_p50, frame_p99 = np.percentile(frames[:, 0], (50, 99))
+        work_p50, work_p99 = np.percentile(work, (50, 99))
+        return {'frames': len(frames), 'frame_p50': frame_p50, 'frame_p99': frame_p99, 'work_p50': work_p50, 'work_p99': work_p99,
+                'trains_alive': int(frames[-1, COLUMNS.index('trains_alive')]), 'draw_calls': int(frames[-1, COLUMNS.index('draw_calls')])}
+
+    def draw_overlay(self, screen, position) -> pygame.Rect:
+        """Draw the summary of the recent frames at the given position. Returns the rect drawn."""
+        summary = self.summary()
+        if not summary: return pygame.Rect(position, (0, 0))
+        lines = [f"frame p50 {summary['frame_p50']:.1f} p99 {summary['frame_p99']:.1f} ms",
+                 f"work p50 {summary['work_p50']:.1f} p99 {summary['work_p99']:.1f} ms",
+                 f"trains {summary['trains_alive']} draws {summary['draw_calls']}"]
+        font = resources.font(VERY_SMALL_TEXT_SIZE)
+        surfaces = [font.render(line, True, pygame.Color('white')) for line in lines]  # new numbers every frame, not worth caching
+        rect = pygame.Rect(position, (max(surface.get_width() for surface in surfaces) + 8, sum(surface.get_height() for surface in surfaces) + 8))
+        screen.fill((0, 0, 0), rect)
+        y = rect.y + 4
+        for surface in surfaces:
+            screen.blit(surface, (rect.x + 4, y))
+            y += surface.get_height()
+        return rect
+
+    def dump(self, filename:str=PROFILER_TRACE_FILE):
+        """Write the recent frames to filename.csv (one row per frame) and filename.json (the frames and their summary)."""
+        if self.frame_count == 0: return
+        frames = self.recent_frames()
+        with open(filename + '.csv', 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(COLUMNS)
+            writer.writerows([round(value, 3) for value in row] for row in frames.tolist())
+        with open(filename + '.json', 'w') as f:
+            json.dump({'columns': COLUMNS, 'summary': self.summary(), 'frames': np.round(frames, 3).tolist()}, f, separators=(',', ':'))
+        game_logger.info("Frame trace written to %s.csv and %s.json", filename, filename)
+
+
+profiler = Frame_profiler()  # shared by the game loop and the drawing code
+if PROFILER_ENABLED: profiler.enable()
@@ -1,7 +1,22 @@
-import pickle
+import asyncio
+import os
+import random
+import numpy as np
 import pygame
 
 from map import *
+from game_ui_utils import coalesce_motion_events, Text_label
+from simulation import Simulation
+from track_graph import Track_graph
+from event_scheduler import Event_scheduler
+from camera import Camera
+from background_layer import Background_layer
+import map_io
+from map_generator import generate_map
+from edit_journal import Edit_journal, Autosave_failed
+from session_recording import Session_recorder
+from frame_profiler import profiler
+from map_elements.train_store import EN_ROUTE, STRANDED
 
 
 # This is a game of routing colored trains to stations of same color.
@@ -12,23 +27,44 @@ from map import *
 
 class Game:
 
-    def __init__(self):
+    def __init__(self, journal:Edit_journal=None, seed:int=None):
+        # journal: where the map is autosaved, by default the AUTOSAVE_* files (e.g. the benchmark autosaves elsewhere, not to clobber the player's map)
+        # seed: of the game's random generator, from which all the randomness of the game derives (station colors, trains, random levels), a random one by default
 
         pygame.init()
+        if PLATFORM_NAME: game_logger.info('Running on %s', PLATFORM_NAME)
+        else: game_logger.warning('Unrecognized OS: %s, defaulting to GAME_SPACE_SCALE_FACTOR=%s', platform.system(), GAME_SPACE_SCALE_FACTOR)
         pygame.display.set_caption("Train Routing Puzzle")
         self.clock = pygame.time.Clock()
+        self.rng = random.Random(seed)
 
-        # map-related gameplay items:
-        self.map = Map()
-        self.trains = []
-        # map state:
-        self.trains_en_route = 0
-        self.trains_at_destination = 0
-        self.time_to_next_train_spawn = 0
+        # map-related gameplay items (the map, trains, spawn timer and scores) live in the headless simulation, the Game only drives and renders it:
+        # the map is autosaved after every edit, and restored from the autosave at start if the game didn't close normally (e.g. after a crash):
+        self.journal = journal if journal is not None else Edit_journal()
+        restore_error = None
+        try:
+            restored_map = self.journal.recover()
+        except Exception as e:
+            restored_map, restore_error = None, e
+        self.simulation = Simulation(restored_map or Map(), ticks_per_second=SIMULATION_TICK_RATE, seed=self.new_seed())
+        self.map.rng.seed(self.new_seed())
+        data = map_io.map_to_data(self.map)  # once for both the autosave and the recorder, each one just keeps it
+        self.journal.start(self.map, data)
+        # the game played is recorded, to be replayed if something went wrong (see session_recording):
+        self.recorder = Session_recorder()
+        self.recorder.start(self.simulation, data)
+        # The simulation runs at a fixed SIMULATION_TICK_RATE, independent of the frame rate: each frame runs the ticks due for the time it took
+        #     (none, one or, fast-forwarding, many, those in bulk by the event scheduler), and the fraction of a tick left over is carried to the next frame.
+        #     The trains are drawn that fraction of a tick further than where the last tick left them, so they move smoothly at any frame rate.
+        self.scheduler = Event_scheduler(self.simulation)
+        self.speed = SIMULATION_SPEEDS[0]
+        self.pending_ticks = 0.0  # the fraction of a tick due but not run yet
+        self.tasks = set()  # background work in progress (saving, loading), as asyncio tasks of the game loop
 
         # UI elements:
 
         self.screen = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
+        Train_sprites.prewarm(ELEMENT_POSSIBLE_COLORS) # so that spawning trains never hitches
         toolbar_y = MAP_HEIGHT * ELEMENT_SIZE + SCOREBOARD_HEIGHT + BUTTON_MARGIN
         # Palette buttons (to draw on the map):
         self.base_station_button = ToggleButton(BUTTON_MARGIN, toolbar_y, BUTTON_WIDTH, BUTTON_HEIGHT, "Base")
@@ -40,119 +76,210 @@ class Game:
 
         # Other tool buttons:
         toolbar_row2_y = toolbar_y + BUTTON_MARGIN * 2 + BUTTON_HEIGHT
+        self.random_button = Button(WINDOW_WIDTH - (BUTTON_MARGIN + BUTTON_WIDTH) * 5, toolbar_row2_y, BUTTON_WIDTH, BUTTON_HEIGHT, "Random")
         self.new_button  = Button(WINDOW_WIDTH - (BUTTON_MARGIN + BUTTON_WIDTH) * 4, toolbar_row2_y, BUTTON_WIDTH, BUTTON_HEIGHT, "New")
         self.save_button = Button(WINDOW_WIDTH - (BUTTON_MARGIN + BUTTON_WIDTH) * 3, toolbar_row2_y, BUTTON_WIDTH, BUTTON_HEIGHT, "Save")
         self.load_button = Button(WINDOW_WIDTH - (BUTTON_MARGIN + BUTTON_WIDTH) * 2, toolbar_row2_y, BUTTON_WIDTH, BUTTON_HEIGHT, "Load")
         self.play_button = Button(WINDOW_WIDTH - BUTTON_MARGIN - BUTTON_WIDTH, toolbar_row2_y, BUTTON_WIDTH, BUTTON_HEIGHT, "Play")
-        self.control_buttons = [self.play_button, self.new_button, self.save_button, self.load_button]
+        self.control_buttons = [self.play_button, self.new_button, self.save_button, self.load_button, self.random_button]
 
         self.popup_active = False
         self.popup_message = None
         self.FPS = FPS_SETUP
-        self.font_score = pygame.font.Font(None, LARGE_TEXT_SIZE)
-        self.font_score_small = pygame.font.Font(None, SMALL_TEXT_SIZE)
+        # the texts of the scoreboard and of the popup, rendered only when they change:
+        self.score_ok_label = Text_label(LARGE_TEXT_SIZE)
+        self.score_nok_label = Text_label(LARGE_TEXT_SIZE)
+        self.speed_label = Text_label(SMALL_TEXT_SIZE)
+        self.popup_label = Text_label(POPUP_TEXT_SIZE)
         #state:
         self.game_state = Game_state.SETUP
-        self.score_ok = 0
-        self.score_nok = 0
-
-
-    def handle_events(self):
-        for event in pygame.event.get():
-
-            if event.type in (pygame.MOUSEBUTTONDOWN, pygame.KEYDOWN) and self.popup_active == True:
-                self.popup_active = False
-                return True
-            
-            if event.type == pygame.QUIT:
-                return False
-    
-            #handle clicks on palette buttons:
-            for button in self.palette_buttons:
-                if button.handle_event(event): # if button was pressed:
-                     # pop all other buttons (they might be toggle buttons)
-                    for other_button in self.palette_buttons:
-                        if other_button!=button:
-                            other_button.is_selected = False
-                    if button == self.eraser_button and button.alt_pressed:
-                        self.map = Map() # start over
-
-                    return True
-
-            if self.play_button.handle_event(event):
-                if self.game_state == Game_state.SETUP:
-                    self.start_game()
-                elif self.game_state == Game_state.RUNNING:
-                    self.stop_game()
+        # the part of the window showing the map, through a camera which can pan (dragging with the right mouse button, arrow keys) and zoom (mouse wheel, +/-):
+        self.camera = Camera(pygame.Rect(0, 0, MAP_WIDTH * ELEMENT_SIZE, MAP_HEIGHT * ELEMENT_SIZE + 1))  # +1 for the grid line below the last row
+        self.camera.set_map(self.map)
+        self.is_panning = False
+        # rendering state, to redraw only what changed from one frame to the next:
+        self.background = Background_layer(self.map, self.camera)
+        self.toolbar_rect = pygame.Rect(0, MAP_HEIGHT * ELEMENT_SIZE + 1, WINDOW_WIDTH, WINDOW_HEIGHT - MAP_HEIGHT * ELEMENT_SIZE - 1)
+        self.train_rects = []  # where the trains (and the profiler overlay) were drawn in the previous frame
+        self.toolbar_state = None  # what was shown in the toolbar in the previous frame
+        self.popup_shown = False
+        self.full_redraw_needed = True
+        if restore_error is not None:
+            self.show_message(f"Could not restore the autosaved map: {str(restore_error)}")
+        elif self.journal.recovery_errors:
+            self.show_message(f"Restored your map, but not all of it: {self.journal.recovery_errors[0]}")
+        elif len(self.map.map_elements) > 0:
+            self.show_message("The game did not close properly, your map was restored.")
+
+    # shortcuts to the simulation state, which is what the UI reads and edits:
+    @property
+    def map(self): return self.simulation.map
+    @map.setter
+    def map(self, value): self.set_map(value)
+
+    def set_map(self, map:Map, track_graph:Track_graph=None, data:dict=None):
+        # track_graph and data: the compiled map and its plain data, if already made (e.g. by load_map, in the background),
+        #     otherwise they are made here, in the game loop, which is fine for small maps only (e.g. the new empty one)
+        if data is None: data = map_io.map_to_data(map)  # once for both the autosave and the recorder
+        self.simulation.set_map(map, track_graph, seed=self.new_seed())
+        map.rng.seed(self.new_seed())
+        self.journal.start(map, data)  # from now on, the new map is the one autosaved
+        self.recorder.start(self.simulation, data)
+
+    def new_seed(self) -> int:
+        return self.rng.randrange(2**32)
+    @property
+    def trains(self): return self.simulation.trains
+    @property
+    def score_ok(self): return self.simulation.score_ok
+    @property
+    def score_nok(self): return self.simulation.score_nok
+
+    def handle_events(self, events:list=None):
+        # All the events queued since the previous frame are handled (none is left for later or lost, however many came),
+        #     with the mouse movements in between clicks merged, as only where the mouse went matters, not in how many steps.
+        if events is None: events = pygame.event.get()
+        app_running = True
+        for event in coalesce_motion_events(events):
+            app_running = self.handle_event(event) and app_running
+        return app_running
+
+    def handle_event(self, event) -> bool:
+        # Each event goes to the first of these which takes it: the popup, the window, the camera, the palette buttons, the control buttons, the map.
+        # Returns False when the app should quit.
+        if event.type in (pygame.MOUSEBUTTONDOWN, pygame.KEYDOWN) and self.popup_active == True:
+            self.popup_active = False
+            return True
+        
+        if event.type == pygame.QUIT:
+            return False
+
+        if event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):  # the window content was lost (e.g. it was hidden), draw it all again
+            self.full_redraw_needed = True
+            return True
+
+        if event.type == pygame.KEYDOWN and event.key == pygame.K_f:  # fast-forward: next speed
+            self.speed = SIMULATION_SPEEDS[(SIMULATION_SPEEDS.index(self.speed) + 1) % len(SIMULATION_SPEEDS)]
+            return True
+
+        if event.type == pygame.KEYDOWN and event.key == pygame.K_F2:  # debug overlay on/off
+            Map_element.show_debug_labels = not Map_element.show_debug_labels
+            self.background.render_all()
+            self.full_redraw_needed = True
+            return True
+
+        if event.type == pygame.KEYDOWN and event.key == pygame.K_F3:  # frame profiler overlay on/off (profiling from then on)
+            profiler.show_overlay = not profiler.show_overlay
+            profiler.enable()
+            return True
+
+        # camera moves:
+        if event.type == pygame.MOUSEWHEEL:
+            self.camera.zoom_at(event.y, *pygame.mouse.get_pos())
+            return True
+        if event.type == pygame.MOUSEBUTTONDOWN and event.button in (2, 3, 4, 5):  # 4/5 are the wheel, handled above
+            self.is_panning = event.button in (2, 3)
+            return True
+        if event.type == pygame.MOUSEBUTTONUP and event.button in (2, 3):
+            self.is_panning = False
+            return True
+        if event.type == pygame.MOUSEMOTION and self.is_panning:
+            self.camera.pan(*event.rel)
+            return True
+        if event.type == pygame.KEYDOWN:
+            if event.key in (pygame.K_LEFT, pygame.K_RIGHT, pygame.K_UP, pygame.K_DOWN):
+                step = self.camera.view_rect.width // 4
+                self.camera.pan({pygame.K_LEFT: step, pygame.K_RIGHT: -step}.get(event.key, 0), {pygame.K_UP: step, pygame.K_DOWN: -step}.get(event.key, 0))
                 return True
-
-            if self.save_button.handle_event(event):
-                self.save_map("map.pkl")
+            if event.key in (pygame.K_PLUS, pygame.K_EQUALS, pygame.K_KP_PLUS, pygame.K_MINUS, pygame.K_KP_MINUS):
+                self.camera.zoom_at(1 if event.key in (pygame.K_PLUS, pygame.K_EQUALS, pygame.K_KP_PLUS) else -1, *self.camera.view_rect.center)
                 return True
+    
+        #handle clicks on palette buttons:
+        for button in self.palette_buttons:
+            if button.handle_event(event): # if button was pressed:
+                 # pop all other buttons (they might be toggle buttons)
+                for other_button in self.palette_buttons:
+                    if other_button!=button:
+                        other_button.is_selected = False
+                if button == self.eraser_button and button.alt_pressed:
+                    self.map = Map() # start over
 
-            if self.load_button.handle_event(event):
-                self.load_map("map.pkl")
                 return True
 
-            if self.new_button.handle_event(event):
-                self.map = Map()
-                return True
+        if self.play_button.handle_event(event):
+            if self.game_state == Game_state.SETUP:
+                self.start_game()
+            elif self.game_state == Game_state.RUNNING:
+                self.stop_game()
+            return True
+
+        if self.save_button.handle_event(event):
+            self.save_map(MAP_FILE)
+            return True
+
+        if self.load_button.handle_event(event):
+            self.load_map(MAP_FILE if os.path.exists(MAP_FILE) or not os.path.exists(LEGACY_MAP_FILE) else LEGACY_MAP_FILE)
+            return True
+
+        if self.new_button.handle_event(event):
+            self.map = Map()
+            return True
+
+        if self.random_button.handle_event(event):
+            self.random_level()
+            return True
+
+        # handle clicks on map area:
+        if event.type == pygame.MOUSEBUTTONDOWN:
+            x,y = event.pos  # where the click was, the mouse may have moved since
+            tile = self.camera.screen_to_tile(x, y)
+            if self.camera.view_rect.collidepoint(x, y) and self.map.map_elements.in_bounds(*tile):
+                
+                self.map.set_click_location(*tile)
 
-            # handle clicks on map area:
-            if event.type == pygame.MOUSEBUTTONDOWN:
-                x,y = pygame.mouse.get_pos()
-                if x <= MAP_WIDTH*ELEMENT_SIZE and y <= MAP_HEIGHT*ELEMENT_SIZE:
-                    
-                    self.map.set_click_location(x, y)
+                if self.game_state == Game_state.SETUP:
+                
+                    if self.station_button.is_selected and self.map.clicked_element is None:
+                        if len(self.map.stations) == len(ELEMENT_POSSIBLE_COLORS):
+                            self.show_message(f'Maximum stations reached ({len(ELEMENT_POSSIBLE_COLORS)})')
+                        else:
+                            self.map.add_station()
 
-                    if self.game_state == Game_state.SETUP:
-                    
-                        if self.station_button.is_selected and self.map.clicked_element is None:
-                            if len(self.map.stations) == len(ELEMENT_POSSIBLE_COLORS):
-                                self.show_message(f'Maximum stations reached ({len(ELEMENT_POSSIBLE_COLORS)})')
-                            else:
-                                self.map.add_station()
+                    if self.base_station_button.is_selected and self.map.clicked_element is None:
+                        self.map.add_base_station()
 
-                        if self.base_station_button.is_selected and self.map.clicked_element is None:
-                            self.map.add_base_station()
+                    if self.track_button.is_selected and self.map.clicked_element is None:
+                        self.map.add_track_by_click()
 
-                        if self.track_button.is_selected and self.map.clicked_element is None:
-                            self.map.add_track_by_click()
+                    if (self.switch_button.is_selected and # the switch can be placed on an empty tile or overwrite a track segment
+                        (self.map.clicked_element is None or isinstance(self.map.clicked_element,Track_segment))):
+                        self.map.add_switch()
 
-                        if (self.switch_button.is_selected and # the switch can be placed on an empty tile or overwrite a track segment
-                            (self.map.clicked_element is None or isinstance(self.map.clicked_element,Track_segment))):
-                            self.map.add_switch()
+                    if (self.eraser_button.is_selected and self.map.clicked_element is not None):
+                        self.map.erase_element()
 
-                        if (self.eraser_button.is_selected and self.map.clicked_element is not None):
-                            self.map.erase_element()
+                elif self.game_state == Game_state.RUNNING and isinstance(self.map.clicked_element, Switch):
+                    self.simulation.toggle_switch(self.map.clicked_element)
 
-                    elif self.game_state == Game_state.RUNNING and isinstance(self.map.clicked_element, Switch):
-                        self.map.clicked_element.toggle()
+            return True
+ 
 
+        # Handle track placement. This is a bit different than the above elements placement, as we use a dragging mechanism so we have to consider the mouse movement event too.
+        # We have 2 separate events for which we lay segments: 
+        #    MOUSEBUTTONDOWN (for the first segment in a chain) - for connecting the segment, we look for neighbors 
+        #    MOUSEMOTION (for next segments in a chain) - for connecting the segment, we ignore neighbors and just connect along the line dragged by the user, to avoid possibly unwanted neighbor connections
+        if self.game_state == Game_state.SETUP and self.map.is_dragging_track and self.track_button.is_selected:
+            
+            if event.type == pygame.MOUSEMOTION:
+                # along all the positions the mouse went through since the previous motion handled, not just straight to the last one:
+                for position in event.path:
+                    self.map.add_track_drag(*self.camera.screen_to_tile(*position))
                 return True
- 
 
-            # Handle track placement. This is a bit different than the above elements placement, as we use a dragging mechanism so we have to consider the mouse movement event too.
-            # We have 2 separate events for which we lay segments: 
-            #    MOUSEBUTTONDOWN (for the first segment in a chain) - for connecting the segment, we look for neighbors 
-            #    MOUSEMOTION (for next segments in a chain) - for connecting the segment, we ignore neighbors and just connect along the line dragged by the user, to avoid possibly unwanted neighbor connections
-            if self.game_state == Game_state.SETUP and self.map.is_dragging_track and self.track_button.is_selected:
-                
-                if event.type == pygame.MOUSEMOTION:
-                    self.map.add_track_drag()
-                    return True
-
-                if event.type == pygame.MOUSEBUTTONUP:
-                    #finalize by searching a downstraem connection for the last placed segment during this mouse drag:
-                    if len(self.map.current_track_chain) > 0:
-                        if not self.map.scan_connect_downstream(element_to_be_connected=self.map.current_track_chain[-1],
-                                                                current_tile_x=self.map.previous_track_tile_position[0],
-                                                                current_tile_y=self.map.previous_track_tile_position[1]):
-                            self.map.assign_free_end_defaults(self.map.current_track_chain[-1]) # if no neighbor at the end to connect, just straighten the free end
-                    self.map.is_dragging_track = False
-                    self.map.previous_track_tile_position = None
-                    self.map.current_track_chain = []
-                    return True
+            if event.type == pygame.MOUSEBUTTONUP:
+                self.map.finish_track_drag()
+                return True
 
         return True
 
@@ -162,7 +289,10 @@ class Game:
         elif len(self.map.stations) == 0:
             self.show_message("Place at least one destination station before starting the game.")
         else:
-            self.game_state = Game_state.RUNNING  # signal to run_app that it needs to call update_map
+            self.game_state = Game_state.RUNNING  # signal to run_app that it needs to advance the simulation
+            self.simulation.start()
+            self.recorder.record('start')
+            self.pending_ticks = 0.0
             for button in self.palette_buttons:
                 button.is_enabled = False
                 button.is_selected = False
@@ -171,115 +301,245 @@ class Game:
 
     def stop_game(self):
         self.game_state = Game_state.SETUP  # also signals to run_app to stop
+        self.recorder.record('stop')
         for button in self.palette_buttons:
             button.is_enabled = True
         self.play_button.text = "Play"
         self.FPS = FPS_SETUP
 
     def update_map(self):
-
-        en_route_trains = sum(1 for train in self.trains if train.train_status == Train_status.EN_ROUTE)
-
-        # Spawn new train if enough time has passed since last spawn and the map is not too loaded:
-        if self.time_to_next_train_spawn <= 0 and en_route_trains <= 7:
-            self.trains.append(Train(self.map.base_station.x,
-                                   self.map.base_station.y,
-                                   color=random.choice([station.color for station in self.map.stations]),
-                                   current_tile=self.map.base_station,
-                                   train_status=Train_status.EN_ROUTE))
-            self.time_to_next_train_spawn = random.randint(3 * self.FPS, 10 * self.FPS)  # Convert seconds to frames
-        else:
-            self.time_to_next_train_spawn -= 1 # nothing spawned, clock ticks 1 more frame
-
-        # Update existing trains:
-        for train in self.trains:
-            if train.train_status in (Train_status.IN_BASE, Train_status.EN_ROUTE):
-                # advance and then count resulted points, if any
-                match train.advance():
-                    case  1: self.score_ok  += 1
-                    case -1: self.score_nok += 1
-            
+        self.simulation.update()
+
+    def advance(self, frame_seconds:float):
+        """Run the simulation ticks due after frame_seconds of real time."""
+        self.pending_ticks += min(frame_seconds, MAX_FRAME_TIME) * SIMULATION_TICK_RATE * self.speed
+        ticks = int(self.pending_ticks)
+        self.pending_ticks -= ticks
+        if ticks == 1:
+            self.update_map()
+        elif ticks > 1:
+            self.scheduler.run(ticks)  # same result as that many update_map() calls, but skipping the ticks where nothing happens
     
     def show_message(self, message):
         self.popup_active = True
         self.popup_message = message
     
-    def draw_popup(self):
+    def draw_popup(self) -> pygame.Rect:
         popup_rect = pygame.Rect(0, WINDOW_HEIGHT//2, WINDOW_WIDTH, int(100 * GAME_SPACE_SCALE_FACTOR))
         pygame.draw.rect(self.screen, (200, 200, 200), popup_rect)  # Light gray background
-        font_popup_size = int(24 * GAME_SPACE_SCALE_FACTOR)
-        font_popup = pygame.font.Font(None, font_popup_size)
-        text = font_popup.render(self.popup_message, True, (0, 0, 0))
+        text = self.popup_label.render(self.popup_message, (0, 0, 0))
         self.screen.blit(text, (popup_rect.x + int(4 * GAME_SPACE_SCALE_FACTOR), popup_rect.y + int(20 * GAME_SPACE_SCALE_FACTOR) ))
-        
-    
-    def draw(self):
-        self.screen.fill(BACKGROUND_COLOR)
-        
-        # Draw grid lines
-        for x in range(0, MAP_WIDTH*ELEMENT_SIZE+1, ELEMENT_SIZE): pygame.draw.line(self.screen, pygame.Color('black'), (x, 0), (x, MAP_HEIGHT*ELEMENT_SIZE), 1)
-        for y in range(0, MAP_WIDTH*ELEMENT_SIZE+1, ELEMENT_SIZE): pygame.draw.line(self.screen, pygame.Color('black'), (0, y), (MAP_WIDTH*ELEMENT_SIZE, y), 1)
-
-        for row in self.map.map_elements:
-            for element in row:
-                if element is not None:
-                    element.draw(self.screen)
-        
+        return popup_rect
+
+    def draw_toolbar(self):
+        self.screen.fill(BACKGROUND_COLOR, self.toolbar_rect)
         # scoreboard:
         if self.game_state != Game_state.SETUP:
-            text_surface = self.font_score.render(str(self.score_ok), True, pygame.Color('white'))
+            text_surface = self.score_ok_label.render(str(self.score_ok), pygame.Color('white'))
             self.screen.blit(text_surface, (WINDOW_WIDTH // 2 , MAP_HEIGHT * ELEMENT_SIZE + SCOREBOARD_HEIGHT//5))
-            text_surface = self.font_score.render(str(self.score_nok), True, pygame.Color('black'))
+            text_surface = self.score_nok_label.render(str(self.score_nok), pygame.Color('black'))
             self.screen.blit(text_surface, (WINDOW_WIDTH // 2 - SMALL_TEXT_SIZE , MAP_HEIGHT * ELEMENT_SIZE + SCOREBOARD_HEIGHT//5))
+        if self.speed != 1:  # fast-forwarding
+            text_surface = self.speed_label.render(f"x{self.speed}", pygame.Color('white'))
+            self.screen.blit(text_surface, (BUTTON_MARGIN, MAP_HEIGHT * ELEMENT_SIZE + SCOREBOARD_HEIGHT//5))
 
-
-
-        # trains must be drawn after the other map elemens, as they overlap:
-        for train in self.trains: 
-            if train.train_status in (Train_status.EN_ROUTE, Train_status.STRANDED): 
-                train.draw(self.screen)
-        
         for button in (self.palette_buttons + self.control_buttons): button.draw(self.screen)
 
-        if self.popup_active: self.draw_popup()
-                
-        pygame.display.flip()
+    def draw_trains(self) -> list:
+        # Only the trains inside the view are drawn (found with a vectorized test on all of them), as sprites or, zoomed out, as dots:
+        store = self.simulation.train_store
+        status = store.status[:store.count]
+        shown = np.flatnonzero((status == EN_ROUTE) | (status == STRANDED))
+        graph, nodes, distances = self.simulation.track_graph, store.node[shown], store.distance[shown]
+        if self.pending_ticks > 0:  # interpolated: where the moving trains are between the last tick and the next one (not beyond the end of their tile though)
+            distances = np.where(status[shown] == EN_ROUTE, np.minimum(distances + TRAIN_SPEED * self.pending_ticks, graph.length[nodes]), distances)
+        world_x, world_y = graph.positions(nodes, distances)
+        view_x, view_y = self.camera.world_to_view(world_x, world_y)
+        margin = ELEMENT_SIZE  # the train sprites are about one tile large
+        width, height = self.camera.view_rect.size
+        visible = np.flatnonzero((view_x > -margin) & (view_x < width + margin) & (view_y > -margin) & (view_y < height + margin))
+        if self.camera.is_detailed:
+            return self.screen.blits([self.trains[shown[i]].sprite(self.camera, (world_x[i], world_y[i])) for i in visible])
+        return [self.trains[shown[i]].draw_dot(self.screen, self.camera, (world_x[i], world_y[i])) for i in visible]
+
+    def draw(self):
+        # Only what changed since the previous frame is redrawn and sent to the display:
+        #     the static part of the map is blitted from the background layer, which itself re-renders only the tiles changed by the editor or by switch toggles,
+        #     the trains are erased from where they were and drawn again, and the toolbar is redrawn only when something in it changed.
+        if self.background.map is not self.map: # a new map was created or loaded
+            self.camera.set_map(self.map)
+            self.background.set_map(self.map)
+            self.full_redraw_needed = True
+        if self.popup_active != self.popup_shown: self.full_redraw_needed = True # the popup covers a part of the map
+
+        view_rect = self.camera.view_rect
+        if self.full_redraw_needed:
+            self.background.update()
+            self.screen.fill(BACKGROUND_COLOR)
+            self.screen.blit(self.background.surface, view_rect)
+            dirty_rects = [self.screen.get_rect()]
+        else:
+            dirty_rects = [rect.move(view_rect.topleft) for rect in self.background.update()] + self.train_rects
+            for rect in dirty_rects: self.screen.blit(self.background.surface, rect, rect.move(-view_rect.x, -view_rect.y))
 
-    def run_app(self):
+        # trains must be drawn after the other map elemens, as they overlap:
+        self.screen.set_clip(view_rect)
+        with profiler.phase('trains'):
+            self.train_rects = self.draw_trains()
+        profiler.count_draws(len(self.train_rects))
+        if profiler.show_overlay: self.train_rects.append(profiler.draw_overlay(self.screen, view_rect.topleft))  # erased next frame, like the trains
+        self.screen.set_clip(None)
+        dirty_rects += self.train_rects
+
+        toolbar_state = (self.game_state, self.score_ok, self.score_nok, self.speed,
+                         tuple((button.text, button.is_hovered, button.is_selected, button.is_enabled) for button in self.palette_buttons + self.control_buttons))
+        if self.full_redraw_needed or toolbar_state != self.toolbar_state:
+            with profiler.phase('buttons'):
+                self.draw_toolbar()
+            profiler.count_draws(len(self.palette_buttons + self.control_buttons))
+            self.toolbar_state = toolbar_state
+            dirty_rects.append(self.toolbar_rect)
+
+        if self.popup_active: dirty_rects.append(self.draw_popup())
+        self.popup_shown = self.popup_active
+
+        with profiler.phase('flip'):
+            pygame.display.update(dirty_rects)
+        self.full_redraw_needed = False
+
+    def is_idle(self) -> bool:
+        """True when nothing moves by itself (no trains running, no background work, nothing left to draw), so only the user's input can change what is shown."""
+        return (self.game_state != Game_state.RUNNING and not self.tasks
+                and not self.full_redraw_needed and self.popup_active == self.popup_shown)
+
+    async def wait_for_events(self) -> list:
+        """The next events, waiting for them (IDLE_TIMEOUT at most, then the list is empty)."""
+        if THREADS_AVAILABLE and asyncio.all_tasks() == {asyncio.current_task()}:
+            event = pygame.event.wait(IDLE_TIMEOUT)
+            return [event] + pygame.event.get() if event.type != pygame.NOEVENT else []
+        # the browser can't block, nor can the game loop when other coroutines share it (e.g. a script driving the Game):
+        #     check now and then, giving the control back in between
+        for _ in range(int(IDLE_TIMEOUT / 1000 / IDLE_POLL_INTERVAL)):
+            events = pygame.event.get()
+            if events: return events
+            await asyncio.sleep(IDLE_POLL_INTERVAL)
+        return []
+
+    async def run_app(self):
+        # The game loop is a coroutine, so that it can run in the browser (pygbag), where it must give the control back once per frame,
+        #     and so that saving and loading can go on as asyncio tasks (see run_task) while frames are still drawn.
+        if not THREADS_AVAILABLE: asyncio.get_running_loop().create_task(self.journal.run_async())
         app_running = True
+        frame_seconds = 0
         while app_running:
-            app_running = self.handle_events()
+            if self.is_idle():
+                # Instead of redrawing the same picture at full frame rate, sleep until the user does something, and draw only then:
+                events = await self.wait_for_events()
+                if not events:  # nothing happened
+                    await asyncio.sleep(0)
+                    continue
+                self.clock.tick()  # the frame time starts now, not when the sleep started
+                frame_seconds = 0
+                profiler.start_frame()
+                with profiler.phase('handle_events'):
+                    app_running = self.handle_events(events)
+            else:
+                profiler.start_frame()
+                with profiler.phase('handle_events'):
+                    app_running = self.handle_events()
             if self.game_state == Game_state.RUNNING:
-                self.update_map()
-            self.draw()
-            self.clock.tick(self.FPS)
+                with profiler.phase('update'):
+                    self.advance(frame_seconds)
+            with profiler.phase('draw'):
+                self.draw()
+            with profiler.phase('tick'):
+                frame_seconds = self.clock.tick(self.FPS) / 1000
+            if profiler.enabled: profiler.end_frame(self.simulation.train_store.count)
+            await asyncio.sleep(0)  # lets the background tasks run
+        for task in list(self.tasks): await task  # e.g. a save just started
+        self.journal.close()
+        if RECORDING_FILE: self.recorder.save(RECORDING_FILE)
+        profiler.dump()
         pygame.quit()
 
+    def run_task(self, coroutine):
+        # Runs the coroutine as a task of the game loop, the game going on meanwhile. Called from outside of the game loop (e.g. scripts driving the Game), just runs it.
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            asyncio.run(coroutine)
+            return
+        task = loop.create_task(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def in_background(self, function, *args):
+        """The result of function(*args), computed on another thread so the game loop goes on meanwhile (where there are threads)."""
+        if THREADS_AVAILABLE: return await asyncio.to_thread(function, *args)
+        await asyncio.sleep(0)  # at least a frame is drawn before
+        return function(*args)
+
     def save_map(self, filename):
         """Save the current map to a file"""
+        self.run_task(self.save_map_task(filename))
+
+    async def save_map_task(self, filename):
         try:
-            with open(filename, 'wb') as f:
-                pickle.dump(self.map, f)
+            try:
+                await asyncio.wrap_future(self.journal.save_copy(filename))  # written by the autosave, from its copy of the map
+            except Autosave_failed:
+                # that copy can't be trusted: the map itself is taken instead (here, in the game loop, the only one editing it), and written in the background
+                await self.in_background(map_io.save_map_data, map_io.map_to_data(self.map), filename)
             self.show_message(f"Map saved successfully as {filename}.")
         except Exception as e:
             self.show_message(f"Error saving map: {str(e)}")
 
+    def random_level(self):
+        """Replace the (empty) map with a generated one"""
+        if len(self.map.map_elements) > 0:
+            self.show_message("Your map is beautiful, if you are sure, clear it first please.")
+        else:
+            self.run_task(self.random_level_task(self.rng.randrange(1000000)))
+
+    async def random_level_task(self, seed:int):
+        # like loading a map: generating, converting and compiling it happen in the background, only the switch to it is done in the game loop
+        map = await self.in_background(lambda: generate_map(seed=seed))
+        data = await self.in_background(map_io.map_to_data, map)
+        track_graph = await self.in_background(Track_graph, map)
+        if len(self.map.map_elements) > 0:  # edited meanwhile
+            self.show_message("Your map is beautiful, if you are sure, clear it first please.")
+            return
+        self.set_map(map, track_graph, data)
+        self.show_message(f"Random level {seed}, good luck!")
+
     def load_map(self, filename):
         """Load a map from a file"""
         # Check if current map has any non-None elements
-        if any(element is not None for row in self.map.map_elements for element in row):
+        if len(self.map.map_elements) > 0:
             self.show_message("Your map is beautiful, if you are sure, clear it first please.")
         else:
-            try:
-                with open(filename, 'rb') as f:
-                    self.map = pickle.load(f)
-                self.show_message("Map loaded successfully.")
-            except FileNotFoundError:
-                self.show_message(f"Map file {filename} not found!")
-            except Exception as e:
-                self.show_message(f"Error loading map: {str(e)}")
+            self.run_task(self.load_map_task(filename))
+
+    async def load_map_task(self, filename):
+        # reading, building and compiling the map happen in the background, only the switch to the new map is done in the game loop
+        try:
+            data = await self.in_background(map_io.read_map_data, filename)  # also migrates the maps pickled by older versions
+            map = await self.in_background(map_io.map_from_data, data)
+            track_graph = await self.in_background(Track_graph, map)
+        except FileNotFoundError:
+            self.show_message(f"Map file {filename} not found!")
+            return
+        except Exception as e:
+            self.show_message(f"Error loading map: {str(e)}")
+            return
+        if len(self.map.map_elements) > 0:  # edited while loading
+            self.show_message("Your map is beautiful, if you are sure, clear it first please.")
+            return
+        self.set_map(map, track_graph, data)
+        self.show_message("Map loaded successfully.")
 
 
 if __name__ == "__main__":
+    configure_logging()
     game = Game()
-    game.run_app()
+    asyncio.run(game.run_app())
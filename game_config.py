@@ -1,25 +1,52 @@
 from enum import Enum, auto
+import logging
+import os
 import pygame
 import platform
 import sys
 
-pygame.init()  # at least for font setup
+# Diagnostics go through this logger, not print(), so they can be turned up or down without touching the code:
+#     DEBUG for the editor traces, INFO for the platform detection, WARNING (the default) for problems only.
+#     The messages below the level cost a single level check, their text is not even formatted.
+# Importing the game modules leaves the logging configuration alone: the programs (the game, the command line tools) call configure_logging() when they start,
+#     the others (e.g. a test runner) configure it as they like.
+LOG_LEVEL = os.environ.get('TRAINS_LOG_LEVEL', 'WARNING')
+game_logger = logging.getLogger('trains')
 
+
+def configure_logging(level:str=LOG_LEVEL):
+    # For the entry points only: shows the messages of the game's logger from the given level up (TRAINS_LOG_LEVEL by default) on stderr
+    if not isinstance(logging.getLevelName(level.upper()), int):
+        sys.exit(f"Invalid log level '{level}' (TRAINS_LOG_LEVEL), it must be one of DEBUG, INFO, WARNING, ERROR, CRITICAL")
+    logging.basicConfig(format='%(levelname)s %(name)s: %(message)s')
+    game_logger.setLevel(level.upper())
+
+# Importing the config (and so the simulation modules) doesn't initialize pygame nor load anything: the Game does that when it starts,
+#     and the fonts and images are loaded when first used (see resources), so the headless tools and the worker processes start fast.
 if sys.platform.startswith('win'):
-    print('Running on Windows')
+    PLATFORM_NAME = 'Windows'
     GAME_SPACE_SCALE_FACTOR = 1
 elif platform.system() == 'Darwin':  # For iOS/macOS
-    print('Running on iOS/macOS')
+    PLATFORM_NAME = 'iOS/macOS'
     GAME_SPACE_SCALE_FACTOR = 2
 elif platform.system() == 'Linux':   # For Android/Linux
-    print('Running on Android/Linux')
+    PLATFORM_NAME = 'Android/Linux'
     GAME_SPACE_SCALE_FACTOR = 2
 else:
+    PLATFORM_NAME = None  # unrecognized, reported when the game starts
     GAME_SPACE_SCALE_FACTOR = 1
-    print(f'Unrecognized OS: {platform.system()}, defaulting to GAME_SPACE_SCALE_FACTOR={GAME_SPACE_SCALE_FACTOR}')
 
 FPS_SETUP = 60
-FPS_RUN = 20 * GAME_SPACE_SCALE_FACTOR
+FPS_RUN = 60  # frames drawn per second while the game runs, the simulation itself advances at SIMULATION_TICK_RATE whatever this is
+SIMULATION_TICK_RATE = 40  # simulation ticks per second of game time, the same on every platform
+SIMULATION_SPEEDS = (1, 2, 10, 100)  # fast-forward factors (game seconds per real second), cycled with the F key
+IDLE_TIMEOUT = 1000  # milliseconds: when nothing moves the game sleeps until the next input, but wakes up at least this often
+IDLE_POLL_INTERVAL = 1 / 30  # seconds: in the browser the game can't block waiting for input, it checks for it this often instead
+THREADS_AVAILABLE = sys.platform != 'emscripten'  # no threads in the browser build (pygbag): the background work runs as asyncio tasks of the game loop instead
+PROFILER_ENABLED = os.environ.get('TRAINS_PROFILE', '0') == '1'  # time the phases of every frame (see frame_profiler), also turned on by showing the overlay (F3)
+PROFILER_FRAMES = 600  # frames kept by the profiler, the last 10 seconds at 60 frames per second
+PROFILER_TRACE_FILE = "frame_trace"  # the profiled frames are written to this .csv and .json when the game exits
+MAX_FRAME_TIME = 0.25  # seconds: after a longer hitch the game time doesn't try to catch up, so it can't snowball
 TRAIN_SPAWN_INTERVAL = 5  # seconds
 MAP_WIDTH = 10
 MAP_HEIGHT = 10
@@ -33,17 +60,28 @@ WINDOW_HEIGHT = MAP_HEIGHT * ELEMENT_SIZE + SCOREBOARD_HEIGHT + BUTTON_HEIGHT *
 LARGE_TEXT_SIZE = int(32 * GAME_SPACE_SCALE_FACTOR)
 SMALL_TEXT_SIZE = int(20 * GAME_SPACE_SCALE_FACTOR)
 VERY_SMALL_TEXT_SIZE = int(16 * GAME_SPACE_SCALE_FACTOR)
+POPUP_TEXT_SIZE = int(24 * GAME_SPACE_SCALE_FACTOR)
+TEXT_CACHE_SIZE = 256  # rendered texts kept for reuse, the least recently used ones are dropped (see resources)
 BACKGROUND_COLOR = (34, 89, 34)
 BUTTON_COLOR = (200, 200, 200)
 BUTTON_HOVER_COLOR = (180, 180, 180)
 BUTTON_SELECTED_COLOR = (150, 150, 150)
 BUTTON_TEXT_COLOR = (0, 0, 0)
 BUTTON_DISABLED_TEXT_COLOR = (100, 100, 100)
-TRAIN_SPEED = 1    # Only integers. ELEMENT_SIZE // FPS_RUN would result in 1 element per second
+MAX_TRAINS_EN_ROUTE = 8  # no new train spawns while this many are on the tracks
+TRAIN_SPEED = ELEMENT_SIZE / 100    # pixels per simulation tick: a tile in 100 ticks (2.5 seconds), whatever the ELEMENT_SIZE of the platform
 UPSTREAM = "upstream"
 DOWNSTREAM = "downstream"
-FONT_VERY_SMALL = pygame.font.Font(None, VERY_SMALL_TEXT_SIZE)
 USE_TRAIN_IMAGE = False
+TRAIN_IMAGE_FILE = "assets/train.png"
+SHOW_DEBUG_LABELS = False  # debug overlay writing the movement versors on the map elements, toggled in game with F2
+ZOOM_LEVELS = (0.125, 0.25, 0.5, 1)  # map view scales, 1 being the elements natural size. Zoomed out, the map is drawn with less detail
+MAP_FILE = "map.json"  # where the Save/Load buttons save/load the map
+LEGACY_MAP_FILE = "map.pkl"  # loaded (and migrated) if there is no MAP_FILE yet, as saved by older versions
+AUTOSAVE_SNAPSHOT_FILE = "autosave.json"  # the map as of the last autosave compaction, restored at start
+AUTOSAVE_JOURNAL_FILE = "autosave.journal"  # the edits done after that snapshot, one line each
+RECORDING_FILE = "last_session.json"  # the last game played is recorded there when the game exits, to replay it (see session_recording), None to not record
+AUTOSAVE_COMPACT_EVERY = 500  # edits journaled before the snapshot is rewritten
 
 ELEMENT_POSSIBLE_COLORS = [pygame.Color('red'),
                            pygame.Color('blue'),
@@ -59,6 +97,7 @@ class Train_status(Enum):
     STRANDED = "stranded"
     IN_HOME_STATION = "in_home_station"
     IN_WRONG_STATION = "in_wrong_station"
+TRAIN_STATUSES = list(Train_status)  # train status arrays hold the index of the status in this list
 
 class Game_state(Enum):
     SETUP = auto()
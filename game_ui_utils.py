@@ -1,5 +1,22 @@
 import pygame
 from game_config import *
+from resources import resources
+
+
+class Text_label:
+    # A text drawn again and again, e.g. a button label or a score: it's looked up in the rendered texts (see resources) only when it changes,
+    #     the Surface being kept in between, so drawing it costs just a comparison and a blit.
+    def __init__(self, size:int):
+        self.size = size
+        self.key = None
+        self.surface = None
+
+    def render(self, text:str, color) -> pygame.Surface:
+        key = (text, tuple(color))
+        if key != self.key:
+            self.key = key
+            self.surface = resources.text(text, self.size, color)
+        return self.surface
 
 
 class Button:
@@ -9,17 +26,20 @@ class Button:
         self.is_hovered = False
         self.is_selected = False
         self.is_enabled = True
-        self.font = pygame.font.Font(None, SMALL_TEXT_SIZE)
+        self.label = Text_label(SMALL_TEXT_SIZE)
         self.alt_pressed = False  # True if Alt was pressed during last click
 
     def draw(self, surface):
         color = BUTTON_SELECTED_COLOR if self.is_selected else BUTTON_HOVER_COLOR if self.is_hovered else BUTTON_COLOR
         pygame.draw.rect(surface, color, self.rect)
         pygame.draw.rect(surface, (100, 100, 100), self.rect, 2)  # border
-        text_surface = self.font.render(self.text, True, BUTTON_TEXT_COLOR if self.is_enabled else BUTTON_DISABLED_TEXT_COLOR)
+        text_surface = self.label.render(self.text, BUTTON_TEXT_COLOR if self.is_enabled else BUTTON_DISABLED_TEXT_COLOR)
         text_rect = text_surface.get_rect(center=self.rect.center)
         surface.blit(text_surface, text_rect)
 
+    @property
+    def font(self): return resources.font(self.label.size)  # shared by all the buttons with the same text size
+
     def handle_event(self, event): # by convention, button pressing is signaled by handle_event returning True
         if self.is_enabled:
             if event.type == pygame.MOUSEMOTION:
@@ -44,3 +64,22 @@ class ToggleButton(Button):
             return True # Signify that the toggle button was activated
 
         return button_was_pressed # Return whether the button was pressed (including if only hovered or alt-clicked without toggling)
+
+
+def coalesce_motion_events(events:list) -> list:
+    # Merges each run of consecutive MOUSEMOTION events into a single one: at the last position, with the summed up relative movement,
+    #     and with the positions of all the merged events in a 'path' attribute (so a track drag can follow the whole way the mouse went).
+    # The other events, and so the order of the motions relative to the clicks, are kept as they are.
+    coalesced = []
+    run = []
+    for event in events + [None]:
+        if event is not None and event.type == pygame.MOUSEMOTION:
+            run.append(event)
+            continue
+        if run:
+            coalesced.append(pygame.event.Event(pygame.MOUSEMOTION, pos=run[-1].pos, buttons=run[-1].buttons, touch=getattr(run[-1], 'touch', False),
+                                                rel=(sum(motion.rel[0] for motion in run), sum(motion.rel[1] for motion in run)),
+                                                path=[motion.pos for motion in run]))
+            run = []
+        if event is not None: coalesced.append(event)
+    return coalesced
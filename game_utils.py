@@ -1,4 +1,4 @@
-import math
+import numpy as np
 
 
 class Utils:
@@ -12,26 +12,31 @@ class Utils:
         elif current_tile_x < prev_tile_x: return ('R', 'L')
         elif current_tile_y > prev_tile_y: return ('U', 'D') # this case is for current_tile_x = prev_tile_x
         else: return ('D', 'U')
+    def grow(array:np.ndarray, needed:int, fill=0) -> np.ndarray:
+        """The array if it has room for needed items, otherwise a copy with its capacity doubled (or more, up to needed), the new room filled with fill.
+        For the growing arrays of the structures of arrays (Train_store, Track_graph...), so that adding items one at a time is amortized O(1)."""
+        if len(array) >= needed: return array
+        return np.concatenate((array, np.full(max(needed, 2 * len(array)) - len(array), fill, dtype=array.dtype)))
     def sign(n: int) -> int:
         if n > 0: return 1
         elif n < 0: return -1
         else: return 0
-    def smart_range(start:int, end:int, step:int = 0, inclusive = True):
-        """A version of range() which:
-         - has the option to include the end value
-         - allows implicit descending step, in case start > end"""
-
-        direction_unit = Utils.sign(end - start)
-        if step == 0:
-          step = direction_unit # so it will take a default of either 1 or -1, depending if start->end is ascending or descending
-        if step > 0:
-            return range(start, end + int(inclusive), step)
-        elif step < 0:
-            return range(start, end - int(inclusive), step)
-        else:  # step parameter is 0 and start and end are the same - only one thing to do in this case, return the single value
-            return range(start, end + int(inclusive))
-    def round_with_direction(number: float, direction: int) -> int:
-      """Rounds a float to the nearest integer, either flooring or ceiling."""
-      if direction >= 0: return math.ceil(number)
-      else: return math.floor(number)
-    
\ No newline at end of file
+    def grid_line(start_tile_x:int, start_tile_y:int, end_tile_x:int, end_tile_y:int):
+        """The tiles crossed by the straight line from the center of the start tile to the center of the end tile, both included, in order.
+        Consecutive tiles are always side by side (never only diagonal), as the tracks can't go diagonally: where the line passes exactly
+        through a tile corner, the tile along x is taken first. This is Amanatides-Woo grid traversal, in integers, so O(length of the line)."""
+        delta_x, delta_y = abs(end_tile_x - start_tile_x), abs(end_tile_y - start_tile_y)
+        step_x, step_y = Utils.sign(end_tile_x - start_tile_x), Utils.sign(end_tile_y - start_tile_y)
+        tile_x, tile_y = start_tile_x, start_tile_y
+        crossed_x = crossed_y = 0  # tile borders crossed so far along each axis
+        yield tile_x, tile_y
+        for _ in range(delta_x + delta_y):
+            # The line (starting from a tile center) reaches the next vertical tile border at the fraction (2*crossed_x + 1) / (2*delta_x) of its length
+            #     and the next horizontal one at (2*crossed_y + 1) / (2*delta_y): step across whichever comes first (cross-multiplied, to stay in integers).
+            if crossed_y == delta_y or (crossed_x < delta_x and (2 * crossed_x + 1) * delta_y <= (2 * crossed_y + 1) * delta_x):
+                tile_x += step_x
+                crossed_x += 1
+            else:
+                tile_y += step_y
+                crossed_y += 1
+            yield tile_x, tile_y
@@ -0,0 +1,13 @@
+import asyncio
+
+from game import Game
+from game_config import configure_logging
+
+
+# Entry point of the browser build: pygbag runs main.py, and needs the game loop to be a coroutine run by asyncio.
+async def main():
+    configure_logging()
+    game = Game()
+    await game.run_app()
+
+asyncio.run(main())
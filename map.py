@@ -1,14 +1,16 @@
 import random
+from contextlib import contextmanager
 from typing import Tuple
 
 from game_ui_utils import *
 from game_utils import *
 from map_elements import *
+from tile_grid import Tile_grid
 
 
 class Map:
-    def __init__(self):
-        self.map_elements = [[None for x in range(MAP_WIDTH)] for y in range(MAP_HEIGHT)]
+    def __init__(self, width:int=MAP_WIDTH, height:int=MAP_HEIGHT, seed:int=None):
+        self.map_elements = Tile_grid(width, height)  # sparse, indexed by tile: map_elements[tile_x, tile_y]
         self.base_station = None
         self.base_station_tile_position = (-1,-1) # -1 means "doesn't exist"
         self.stations = []
@@ -22,14 +24,85 @@ class Map:
         self.map_x = None
         self.map_y = None
         self.clicked_element = None
-
-    def set_click_location(self, x, y):
-        self.current_tile_x = (x-1)//ELEMENT_SIZE
-        self.current_tile_y = (y-1)//ELEMENT_SIZE
+        # callables notified with (tile_x, tile_y) of every tile whose element or links changed (used to keep derived data in sync, e.g. the compiled track graph):
+        self.change_listeners = []
+        self.batch_depth = 0
+        self.batch_changed_tiles = set()
+        # callables notified with a record (a small dict like {'op': 'station', 'x': 3, 'y': 5, 'color': ...}) of every editor operation,
+        #     from which the operation can be replayed on a copy of the map (used by the autosave journal, see apply_edit):
+        self.edit_listeners = []
+        self.rng = random.Random(seed)  # picks the colors of the new stations
+
+    @property
+    def width(self) -> int: return self.map_elements.width
+    @property
+    def height(self) -> int: return self.map_elements.height
+
+    def add_change_listener(self, listener):
+        self.change_listeners.append(listener)
+
+    def remove_change_listener(self, listener):
+        if listener in self.change_listeners: self.change_listeners.remove(listener)
+
+    def add_edit_listener(self, listener):
+        self.edit_listeners.append(listener)
+
+    def remove_edit_listener(self, listener):
+        if listener in self.edit_listeners: self.edit_listeners.remove(listener)
+
+    def record_edit(self, op:str, tile_x:int, tile_y:int, **fields):
+        for listener in self.edit_listeners:
+            listener({'op': op, 'x': tile_x, 'y': tile_y, **fields})
+
+    def apply_edit(self, record:dict):
+        """Replay an editor operation, as recorded by record_edit. The map must be in the state it was in when the operation was recorded."""
+        op, tile_x, tile_y = record['op'], record['x'], record['y']
+        if op in ('drag', 'drag_end') and self.previous_track_tile_position is None:  # it would do nothing, the map is not in the state it was recorded in
+            raise ValueError(f"No track drag in progress to replay '{op}' on")
+        if op == 'drag': self.add_track_drag(tile_x, tile_y)
+        elif op == 'drag_end': self.finish_track_drag()
+        elif op == 'toggle': self.toggle_switch(self.map_elements[tile_x, tile_y])
+        else:
+            self.set_click_location(tile_x, tile_y)
+            if op == 'station': self.add_station(pygame.Color(record['color']))
+            elif op == 'base': self.add_base_station()
+            elif op == 'track': self.add_track_by_click()
+            elif op == 'switch': self.add_switch()
+            elif op == 'erase': self.erase_element()
+            else: raise ValueError(f"Unknown edit operation '{op}'")
+
+    def mark_changed(self, tile_x, tile_y):
+        # Links only ever go between adjacent tiles, so a change on a tile can only affect the tile itself and its 4 neighbors:
+        for changed_x, changed_y in ((tile_x, tile_y), (tile_x-1, tile_y), (tile_x+1, tile_y), (tile_x, tile_y-1), (tile_x, tile_y+1)):
+            if self.map_elements.in_bounds(changed_x, changed_y):
+                if self.batch_depth > 0:
+                    self.batch_changed_tiles.add((changed_x, changed_y))
+                else:
+                    for listener in self.change_listeners:
+                        listener(changed_x, changed_y)
+
+    @contextmanager
+    def batch_edit(self):
+        """Group several edits: the listeners are notified once per changed tile, when the (outermost) batch ends."""
+        self.batch_depth += 1
+        try:
+            yield self
+        finally:
+            self.batch_depth -= 1
+            if self.batch_depth == 0:
+                changed_tiles, self.batch_changed_tiles = self.batch_changed_tiles, set()
+                for changed_x, changed_y in changed_tiles:
+                    for listener in self.change_listeners:
+                        listener(changed_x, changed_y)
+
+    def set_click_location(self, tile_x, tile_y):
+        # the tile clicked (found by the camera from the screen coordinates)
+        self.current_tile_x = tile_x
+        self.current_tile_y = tile_y
         # click coordinates snapped to map grid (to center of tiles more exactly):
-        self.map_x = (x-1)//ELEMENT_SIZE*ELEMENT_SIZE+ELEMENT_SIZE//2
-        self.map_y = (y-1)//ELEMENT_SIZE*ELEMENT_SIZE+ELEMENT_SIZE//2
-        self.clicked_element = self.map_elements[self.current_tile_x][self.current_tile_y]
+        self.map_x = tile_x*ELEMENT_SIZE+ELEMENT_SIZE//2
+        self.map_y = tile_y*ELEMENT_SIZE+ELEMENT_SIZE//2
+        self.clicked_element = self.map_elements[self.current_tile_x, self.current_tile_y]
 
     def get_neighbor(self, map_tile_x:int, map_tile_y:int, direction:str, exclude:list=None) -> Tuple[str, Map_element]:
          # Returns the first unconnected neighbor element found and its relative position in format l/R/U/D.
@@ -40,18 +113,10 @@ class Map:
         neighbors = {}
         if not exclude: exclude = []
 
-        if map_tile_x > 0 :
-            neighbor = self.map_elements[map_tile_x-1][map_tile_y]
-            if neighbor: neighbors['L']=neighbor
-        if map_tile_x < MAP_WIDTH - 1 : 
-            neighbor = self.map_elements[map_tile_x+1][map_tile_y]
-            if neighbor: neighbors['R']=neighbor
-        if map_tile_y > 0 :
-            neighbor = self.map_elements[map_tile_x][map_tile_y-1]
-            if neighbor: neighbors['U']=neighbor
-        if map_tile_y < MAP_WIDTH - 1 :
-            neighbor = self.map_elements[map_tile_x][map_tile_y+1]
-            if neighbor: neighbors['D']=neighbor
+        # (tiles outside the map are always empty)
+        for end, neighbor_x, neighbor_y in (('L', map_tile_x-1, map_tile_y), ('R', map_tile_x+1, map_tile_y), ('U', map_tile_x, map_tile_y-1), ('D', map_tile_x, map_tile_y+1)):
+            neighbor = self.map_elements.get(neighbor_x, neighbor_y)
+            if neighbor: neighbors[end]=neighbor
         
         # filter out excluded elements:
         neighbors = {end:element for end, element in neighbors.items() if element not in exclude}
@@ -126,8 +191,9 @@ class Map:
         if isinstance(map_element, Switch):
             # We have many end pair combinations for switch.
             # So, to not do repetitive writing, and as a programming exercise, we dynamically loop through all attributes of the map_element with getattr()
-            all_ends_desc = {'end1', 'end2','end2_inactive'}
-            all_ends_possible_values = {'L','R','U','D'}
+            # (tuples, not sets: the iteration order of sets of strings changes from one run to the next, and replaying the same edits must give the same map)
+            all_ends_desc = ('end1', 'end2','end2_inactive')
+            all_ends_possible_values = ('L','R','U','D')
             # reset any default orientations (which were set WITHOUT having an actual neighbor on that side), to recalculate them below
             if not map_element.previous_segment: map_element.end1 = None
             if not map_element.next_segment: map_element.end2 = None
@@ -141,7 +207,7 @@ class Map:
                     connected_ends = {getattr(map_element, end_desc) for end_desc in all_ends_desc if getattr(map_element, end_desc)}
                     if len(connected_ends) > 0:
                         setattr(map_element, unconnected_end_desc,
-                                next(iter(all_ends_possible_values - connected_ends))) # assigns the first unused orientation found
+                                next(end for end in all_ends_possible_values if end not in connected_ends)) # assigns the first unused orientation found
                     else: # none of the 3 ends is connected, set a hardcoded default - this will happen a single time in this loop
                         setattr(map_element, unconnected_end_desc, 'L')
                 else: # all connected, finish:
@@ -168,35 +234,42 @@ class Map:
                 self.clicked_element.previous_segment.next_segment_inactive = None
 
         # finally, clear the element from the map:
-        self.map_elements[self.current_tile_x][self.current_tile_y] = None
+        self.map_elements[self.current_tile_x, self.current_tile_y] = None
+        self.mark_changed(self.current_tile_x, self.current_tile_y)
+        self.record_edit('erase', self.current_tile_x, self.current_tile_y)
 
 
-    def add_station(self):
+    def add_station(self, new_color=None):
 
-        new_color = random.choice([color for color in ELEMENT_POSSIBLE_COLORS if color not in [station.color for station in self.stations]]) # chose a color not previously used
+        if new_color is None:
+            new_color = self.rng.choice([color for color in ELEMENT_POSSIBLE_COLORS if color not in [station.color for station in self.stations]]) # chose a color not previously used
         new_station = Station(x=self.map_x,y=self.map_y,color=new_color)
         self.scan_connect_upstream(element_to_be_connected=new_station, current_tile_x=self.current_tile_x, current_tile_y=self.current_tile_y)
         self.stations.append(new_station)
-        self.map_elements[self.current_tile_x][self.current_tile_y]=new_station
+        self.map_elements[self.current_tile_x, self.current_tile_y]=new_station
+        self.mark_changed(self.current_tile_x, self.current_tile_y)
+        self.record_edit('station', self.current_tile_x, self.current_tile_y, color=new_color)
     
     def add_base_station(self):
 
         self.base_station=Base_station(self.map_x,self.map_y)
         if (self.base_station_tile_position != (-1,-1)):  # if the base station already existed, clear it from its old place - there can be only one:
-            self.map_elements[self.base_station_tile_position[0]][self.base_station_tile_position[1]] = None
+            self.map_elements[self.base_station_tile_position] = None
+            self.mark_changed(*self.base_station_tile_position)
         self.scan_connect_downstream(element_to_be_connected = self.base_station, current_tile_x = self.current_tile_x, current_tile_y = self.current_tile_y)
-        self.map_elements[self.current_tile_x][self.current_tile_y]=self.base_station
+        self.map_elements[self.current_tile_x, self.current_tile_y]=self.base_station
         self.base_station_tile_position = (self.current_tile_x, self.current_tile_y)
+        self.mark_changed(self.current_tile_x, self.current_tile_y)
+        self.record_edit('base', self.current_tile_x, self.current_tile_y)
         
 
     def add_track_by_click(self):
 
-        x, y = pygame.mouse.get_pos()
-        if x <= MAP_WIDTH*ELEMENT_SIZE and y <= MAP_HEIGHT*ELEMENT_SIZE:
-            current_tile = ((x-1)//ELEMENT_SIZE, (y-1)//ELEMENT_SIZE)
+        current_tile = (self.current_tile_x, self.current_tile_y)  # as set by set_click_location
+        if self.map_elements.in_bounds(*current_tile):
             current_tile_x, current_tile_y = current_tile
             
-            if self.map_elements[current_tile_x][current_tile_y] is None: # tracks should not overwrite other elements
+            if self.map_elements[current_tile_x, current_tile_y] is None: # tracks should not overwrite other elements
 
                 self.is_dragging_track = True
                 
@@ -210,76 +283,48 @@ class Map:
                 self.scan_connect_downstream(element_to_be_connected=current_track_segment, current_tile_x=current_tile_x, current_tile_y=current_tile_y, excluded_neighbors=neighbors_connected)
                 
                 # add the track segment to the map and current temp chain:
-                self.map_elements[current_tile_x][current_tile_y] = current_track_segment
+                self.map_elements[current_tile_x, current_tile_y] = current_track_segment
                 self.current_track_chain.append(current_track_segment)
+                self.mark_changed(current_tile_x, current_tile_y)
                 # prepare for mouse dragging, in case it will happen:
                 self.previous_track_tile_position = current_tile                            
+                self.record_edit('track', current_tile_x, current_tile_y)
     
-    def add_track_drag(self):
+    def add_track_drag(self, end_tile_x, end_tile_y):
         # This is for placing tracks by DRAGGING the mouse. Unlike placing by simple click, here it's more simple for already knowing the previous tile to connect to, 
         #   but also more complicated because we have to ASSURE connectedness EVEN if:
         #          - the user draggs accros diagonaly (which is not supported in our neighbor logic)
         #          - or if the user drags so fast that the previous drawn segment is not adjacent to current tile.
 
-        x_mouse, y_mouse = pygame.mouse.get_pos()
-        end_tile_x = abs(x_mouse-1)//ELEMENT_SIZE # abs and -1 are to handle clicks on extreme edges
-        end_tile_y = abs(y_mouse-1)//ELEMENT_SIZE 
-        end_tile = (end_tile_x, end_tile_y)
-         # Normally the start should be at the first tile the mouse hovered over AFTER the previous_track_tile_position (which was handled by add_track_by_clock), 
-         # but for finding out that tile we would need extra maths so, for simplicity, we consider the dragged line as including the previous_track_tile_position, 
-         # then do our calculations, then when laying out the track we skip that first one
-        start_tile_x, start_tile_y = self.previous_track_tile_position
-        is_first_tile_in_line = True
+        end_tile = (end_tile_x, end_tile_y)  # the tile under the mouse
         
-        if (x_mouse <= MAP_WIDTH*ELEMENT_SIZE and y_mouse <= MAP_HEIGHT*ELEMENT_SIZE
-            and end_tile != self.previous_track_tile_position
-            and self.previous_track_tile_position is not None):
-
-            # A bit of math to calculate all the tiles along the way between click location (=previous_track_tile_position) and current (dragged) mouse position.
-            # In most cases, there will be 1 tile only, sometimes 2 or 3 tiles, but in case the CPU is too loaded and our app refreshes with delay, there might be more.
-            # The calculation is to cover those seldom cases.
-            # Basically we have to intersect a line (y=a+b*x) with the grid of units delimiting the tiles
-
-            # We simulate the linear function that passes through our points. We use a bit custom maths instead of the classic y = slope * x + intercept, because of our tile-Manhattan-like geometry https://en.wikipedia.org/wiki/Taxicab_geometry, so which does not support real diagonals.
-            # We will loop through all x positions in the dragged range and for each x we'll get the range of cells to fill with tracks on the y axis.
-            #     For finding this y range, we add increments to start_tile_y. An increment is the size of the entire y delta divided into how many x tiles we have, so that each x receives an equal segment on the y axis.
-
-            incremenet_tiles_y = math.ceil(  (abs(end_tile_y - start_tile_y))  
-                                           / (abs(end_tile_x - start_tile_x) + 1) ) # we add a unit because we work with inclusive start-end for x. For y, the "inclusiveness" will be handled below.
-            print(f"1 incremenet_tiles_y = {incremenet_tiles_y}")
-            if end_tile_y - start_tile_y != 0: incremenet_tiles_y *= Utils.sign(end_tile_y - start_tile_y)  # multipy by sign() to set direction - ascending or descending
-            print(f"2 incremenet_tiles_y = {incremenet_tiles_y}")
-
-            for current_tile_x in Utils.smart_range(start_tile_x, end_tile_x):
-                print(f"x = {current_tile_x}")
-                start_segment_y = start_tile_y + ( incremenet_tiles_y * abs(current_tile_x - start_tile_x) )
-                end_segment_y   = start_tile_y + ( incremenet_tiles_y * (abs(current_tile_x - start_tile_x) + 1) )
-                # In cases of (end_tile_y - start_tile_y) = odd number, this y_to will overshoot by a unit because of the math.ceil() and the +1 we use. 
-                # This is fine for middle segments, as a workaround (literally around!) for not having diagonal layout of tracks (we have https://en.wikipedia.org/wiki/Taxicab_geometry), 
-                #     but for the last segment of course we must not overshoot, as we need to stop exactly where the user stops the mouse/finger. 
-                # So avoid overshoot in the last segment by:
-                if current_tile_x == end_tile_x: end_segment_y = end_tile_y
-
-                print(f"1 y_from = {start_segment_y}, y_to = {end_segment_y}")
-
-                for current_tile_y in Utils.smart_range(start_segment_y, end_segment_y):  # do the actual map placement of track for that y segment:
-
-                    if not (is_first_tile_in_line): # skip the first for the above mentioned reason (first was already drawn by add_track_by_click)
-                    
-                        map_current_x = current_tile_x * ELEMENT_SIZE + ELEMENT_SIZE//2
-                        map_current_y = current_tile_y * ELEMENT_SIZE + ELEMENT_SIZE//2
-                        current_endings = Utils.get_endings_by_prev_tile(*self.previous_track_tile_position, current_tile_x, current_tile_y)
-                        current_track_segment = Track_segment(map_current_x, map_current_y, *current_endings, previous_segment=self.current_track_chain[-1])
-                        # also forward link the previous one to current one:
-                        self.current_track_chain[-1].end2 = Utils.get_opposite_end(current_endings[0])
-                        self.current_track_chain[-1].next_segment = current_track_segment
-                        # Add to map and to track chain list:
-                        self.map_elements[current_tile_x][current_tile_y] = current_track_segment
-                        self.current_track_chain.append(current_track_segment)
-                        #prepare for next iteration:
-                        self.previous_track_tile_position = (current_tile_x, current_tile_y)
-                    
-                    is_first_tile_in_line = False
+        if (self.previous_track_tile_position is not None
+            and self.map_elements.in_bounds(*end_tile)
+            and end_tile != self.previous_track_tile_position):
+
+            # All the tiles along the straight line between the previous tile (already laid) and the current (dragged) mouse position.
+            # In most cases, there will be 1 tile only, but if the user drags fast or our app refreshes with delay, there might be more.
+            # The line goes from tile to side-by-side tile, never diagonally, because of our tile-Manhattan-like geometry https://en.wikipedia.org/wiki/Taxicab_geometry
+            tiles = Utils.grid_line(*self.previous_track_tile_position, end_tile_x, end_tile_y)
+            next(tiles)  # skip the first, it was already laid (by add_track_by_click or by the previous drag)
+            game_logger.debug("Track drag from %s to %s", self.previous_track_tile_position, end_tile)
+
+            with self.batch_edit():  # a fast drag may lay several tiles at once, the listeners get them all together
+                for current_tile_x, current_tile_y in tiles:  # do the actual map placement of track
+                    map_current_x = current_tile_x * ELEMENT_SIZE + ELEMENT_SIZE//2
+                    map_current_y = current_tile_y * ELEMENT_SIZE + ELEMENT_SIZE//2
+                    current_endings = Utils.get_endings_by_prev_tile(*self.previous_track_tile_position, current_tile_x, current_tile_y)
+                    current_track_segment = Track_segment(map_current_x, map_current_y, *current_endings, previous_segment=self.current_track_chain[-1])
+                    # also forward link the previous one to current one:
+                    self.current_track_chain[-1].end2 = Utils.get_opposite_end(current_endings[0])
+                    self.current_track_chain[-1].next_segment = current_track_segment
+                    # Add to map and to track chain list:
+                    self.map_elements[current_tile_x, current_tile_y] = current_track_segment
+                    self.current_track_chain.append(current_track_segment)
+                    self.mark_changed(current_tile_x, current_tile_y)
+                    #prepare for next iteration:
+                    self.previous_track_tile_position = (current_tile_x, current_tile_y)
+            self.record_edit('drag', end_tile_x, end_tile_y)
 
     def add_switch(self):
         new_switch = Switch(self.map_x, self.map_y)
@@ -310,15 +355,46 @@ class Map:
         self.scan_connect_downstream(new_switch, self.current_tile_x, self.current_tile_y, excluded_neighbors=neighbors_connected, is_inactive_end=True)
         
         self.assign_free_end_defaults(new_switch)
-        self.map_elements[self.current_tile_x][self.current_tile_y] = new_switch
+        self.map_elements[self.current_tile_x, self.current_tile_y] = new_switch
+        self.mark_changed(self.current_tile_x, self.current_tile_y)
+        self.record_edit('switch', self.current_tile_x, self.current_tile_y)
+
+    def finish_track_drag(self):
+        #finalize by searching a downstraem connection for the last placed segment during this mouse drag:
+        if len(self.current_track_chain) > 0:
+            if not self.scan_connect_downstream(element_to_be_connected=self.current_track_chain[-1],
+                                                current_tile_x=self.previous_track_tile_position[0],
+                                                current_tile_y=self.previous_track_tile_position[1]):
+                self.assign_free_end_defaults(self.current_track_chain[-1]) # if no neighbor at the end to connect, just straighten the free end
+            self.mark_changed(*self.previous_track_tile_position)
+            self.record_edit('drag_end', *self.previous_track_tile_position)
+        self.is_dragging_track = False
+        self.previous_track_tile_position = None
+        self.current_track_chain = []
+
+    def toggle_switch(self, switch:Switch):
+        switch.toggle()
+        self.mark_changed(switch.x // ELEMENT_SIZE, switch.y // ELEMENT_SIZE)
+        self.record_edit('toggle', switch.x // ELEMENT_SIZE, switch.y // ELEMENT_SIZE)
 
     def __getstate__(self):
         """Return state values to be pickled."""
         state = self.__dict__.copy()
         # Remove any unpicklable attributes if needed
+        state['change_listeners'] = []  # listeners belong to the running game, not to the map
+        state['batch_depth'] = 0
+        state['batch_changed_tiles'] = set()
+        state['edit_listeners'] = []
         return state
 
     def __setstate__(self, state):
         """Restore state from the unpickled state values."""
+        self.change_listeners = []  # maps saved before listeners existed don't have them
+        self.batch_depth = 0
+        self.batch_changed_tiles = set()
+        self.edit_listeners = []
+        self.rng = random.Random()
         self.__dict__.update(state)
+        if isinstance(self.map_elements, list):  # maps saved before the sparse grid have a dense list of columns
+            self.map_elements = Tile_grid.from_columns(self.map_elements)
 
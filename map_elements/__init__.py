@@ -3,7 +3,9 @@ from .track_segment import Track_segment
 from .switch import Switch
 from .station import Station
 from .base_station import Base_station
+from .train_sprites import Train_sprites
 from .train import Train
+from .train_store import Train_store
 
 __all__ = [
     'Map_element',
@@ -11,5 +13,7 @@ __all__ = [
     'Switch',
     'Station',
     'Base_station',
-    'Train'
+    'Train_sprites',
+    'Train',
+    'Train_store'
 ]
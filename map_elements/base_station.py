@@ -3,17 +3,29 @@ from .map_element import Map_element
 from game_config import *
 
 class Base_station(Map_element): # a black square - like a tunnel hole from which all trains appear
-    
+    __slots__ = ()
+
     def __init__(self,x,y):
         Map_element.__init__(self, x, y, color=pygame.Color('black'))
-        self.base_x_corner = self.x - int(self.size/2 * self.scale_factor)
-        self.base_y_corner = self.y - int(self.size/2 * self.scale_factor)
-        self.base_width = int(self.size * self.scale_factor)
 
-    def draw(self, screen):
+    @property
+    def base_x_corner(self): return self.x - int(self.size/2 * self.scale_factor)
+    @property
+    def base_y_corner(self): return self.y - int(self.size/2 * self.scale_factor)
+    @property
+    def base_width(self): return int(self.size * self.scale_factor)
+
+    def draw(self, screen, offset=(0, 0)):
         pygame.draw.rect(screen, self.color, 
-                        (self.base_x_corner, 
-                         self.base_y_corner,
+                        (self.base_x_corner + offset[0], 
+                         self.base_y_corner + offset[1],
                          self.base_width, self.base_width))
-        super().draw(screen)
+        super().draw(screen, offset)
+
+    def draw_lod(self, screen, camera, offset=(0, 0)):
+        left, top = self.shifted(camera.world_to_view(self.base_x_corner, self.base_y_corner), offset)
+        screen.fill(self.color, (int(left), int(top), max(2, int(self.base_width*camera.zoom)), max(2, int(self.base_width*camera.zoom))))
+        if self.next_segment:  # and its outgoing track, from the center where the trains spawn
+            pygame.draw.line(screen, pygame.Color('white'), self.shifted(camera.world_to_view(self.x, self.y), offset), self.shifted(camera.world_to_view(*self.end2_coordinates), offset),
+                             max(1, int(3*GAME_SPACE_SCALE_FACTOR*camera.zoom)))
 
@@ -1,7 +1,13 @@
 from math import sqrt
 from game_config import *
+from resources import resources
 
 class Map_element:
+    show_debug_labels = SHOW_DEBUG_LABELS  # the debug overlay, writing the movement versors on the elements
+
+    # A map can have hundreds of thousands of elements, so they have slots instead of a __dict__, and keep only what can't be derived:
+    #     the ending coordinates are computed when read, only the movement versor (a square root) is cached.
+    __slots__ = ('x', 'y', '_end1', '_end2', '_versor_x', '_versor_y', 'previous_segment', 'next_segment', 'size', 'color', 'scale_factor', '_geometry_outdated')
 
     # The parameters end1/end2 ('L'/'R'/'U'/'D' for left/right/up/down) and previous/next_segment references are for elements which can be part of chain (track segments, switches...)
     # end1 and previous_segment are towards "upstream" and end2 and next_segment are towards "downstream", relative to the train movement from the base station.
@@ -13,21 +19,18 @@ class Map_element:
         # Take care for end1 and previous_segment to be pointing towards the same neighbor, same for end2 and next_segment. This is used in logic.
         self._end1=end1
         self._end2=end2
-        # below endings coordinates are actual X and Y computed based on L/R/U/D values of end1 and end2 and end2_inactive:
-        self.end1_coordinates = None
-        self.end2_coordinates = None
-        self.versor_x = 0 # for movement direction and heading of potential trains traversing us
-        self.versor_y = 0
+        self._versor_x = 0 # for movement direction and heading of potential trains traversing us
+        self._versor_y = 0
         self.previous_segment = previous_segment
         self.next_segment = next_segment
         self.size = size
         self.color = color
         self.scale_factor = scale_factor
-        self.text = None
-        self.text_rect = None
-        self.recompute_heading() 
+        self._geometry_outdated = True
         
     # The end1 and end2 attributes are implemented as properties in order to add some auto-rearanging or extra logic of the element in some cases. 
+    # Setting them only marks the geometry (the movement versor) as outdated: it is recomputed once, when next read,
+    #     so setting several ends in a row (e.g. in Map.assign_free_end_defaults) doesn't recompute it at every step.
     @property
     def end1(self): return self._end1
     @property
@@ -36,66 +39,99 @@ class Map_element:
     @end1.setter
     def end1(self, value): 
         self._end1 = value
-        self.recompute_heading()
+        self.invalidate_geometry()
         
     @end2.setter
     def end2(self, value): 
         self._end2 = value
-        self.recompute_heading()
+        self.invalidate_geometry()
+
+    def invalidate_geometry(self):
+        self._geometry_outdated = True
+
+    # below endings coordinates are actual X and Y computed based on L/R/U/D values of end1 and end2:
+    @property
+    def end1_coordinates(self): return self.end_coordinates(self._end1)
+    @property
+    def end2_coordinates(self): return self.end_coordinates(self._end2)
+    @property
+    def versor_x(self):
+        if self._geometry_outdated: self.recompute_heading()
+        return self._versor_x
+    @property
+    def versor_y(self):
+        if self._geometry_outdated: self.recompute_heading()
+        return self._versor_y
+
+    def end_coordinates(self, end:str) -> tuple:
+        # coordinates of the point where the element can connect on the given side - left, right, up or down
+        if end == 'L': return (self.x - self.size//2, self.y)
+        if end == 'R': return (self.x + self.size//2, self.y)
+        if end == 'U': return (self.x, self.y - self.size//2) # Note that y axis increases DOWNWARDS in Pygame.
+        if end == 'D': return (self.x, self.y + self.size//2)
+        return (None, None)
     
     def recompute_heading(self):
-        # computes endings coordinates and movement vector (of potential trains traversing us) based on center(x,y) and orientation (end1/2=L/R/U/D)
-        end_coordinates_map = {  # coordinates of points where the element can connect - left, right, up or down
-            'L': (self.x - self.size//2, self.y),
-            'R': (self.x + self.size//2, self.y),
-            'U': (self.x, self.y - self.size//2), # Note that y axis increases DOWNWARDS in Pygame.
-            'D': (self.x, self.y + self.size//2),
-            None: (None, None)
-        }
-        self.end1_coordinates = end_coordinates_map[self._end1]
-        self.end2_coordinates = end_coordinates_map[self._end2]
+        # computes the movement vector (of potential trains traversing us) based on center(x,y) and orientation (end1/2=L/R/U/D)
+        self._geometry_outdated = False
+        end1_coordinates = self.end_coordinates(self._end1)
+        end2_coordinates = self.end_coordinates(self._end2)
         
         # movement versor
         # It only makes sense to calculate it if end2 is set (if the element has a downstream connection)
-        if self.end2_coordinates[0] and self.end2_coordinates[1]:
+        if end2_coordinates[0] and end2_coordinates[1]:
             # the origin of movement can be either end1 (if the element has an upstream connection)
             # or otherwise the centre (as is the case for Base_station)
-            if self.end1_coordinates[0] and self.end1_coordinates[1]:
-                origin_x = self.end1_coordinates[0]
-                origin_y = self.end1_coordinates[1]
+            if end1_coordinates[0] and end1_coordinates[1]:
+                origin_x = end1_coordinates[0]
+                origin_y = end1_coordinates[1]
             else:
                 origin_x = self.x
                 origin_y = self.y
-            detla_x = self.end2_coordinates[0] - origin_x
-            detla_y = self.end2_coordinates[1] - origin_y
+            detla_x = end2_coordinates[0] - origin_x
+            detla_y = end2_coordinates[1] - origin_y
             hypotenuse = sqrt(detla_x*detla_x + detla_y*detla_y)
             
             if hypotenuse == 0: # can happen in some extreme cases for the element to have length 0 (begins where it ends) - a design error, but should be handled
-                self.versor_x = 0
-                self.versor_y = 0
+                self._versor_x = 0
+                self._versor_y = 0
             else:
-                self.versor_x = detla_x / hypotenuse
-                self.versor_y = detla_y / hypotenuse
-        
-        # Write move versors for debugging
-        self.text = FONT_VERY_SMALL.render(f"{self.versor_x:.1f},{self.versor_y:.1f}", True, pygame.Color('white'))
-        self.text_rect = self.text.get_rect(center=(self.x, self.y-ELEMENT_SIZE//3))
+                self._versor_x = detla_x / hypotenuse
+                self._versor_y = detla_y / hypotenuse
+
+    @staticmethod
+    def shifted(point, offset):
+        # the point (given in map coordinates) where it's drawn, when the map is drawn moved by offset
+        return (point[0] + offset[0], point[1] + offset[1])
 
-    def draw(self, screen):
-        # Write movement versors for debugging:
-        screen.blit(self.text, self.text_rect)
+    def draw(self, screen, offset=(0, 0)):
+        # Write movement versors for debugging, only with the debug overlay on. Each different text is rendered once, for all the elements (there are only a few):
+        if Map_element.show_debug_labels:
+            text = resources.text(f"{self.versor_x:.1f},{self.versor_y:.1f}", VERY_SMALL_TEXT_SIZE, pygame.Color('white'))
+            screen.blit(text, text.get_rect(center=self.shifted((self.x, self.y-ELEMENT_SIZE//3), offset)))
         # The rest of drawing will behandled in more specific (derived) classes
 
+    def draw_lod(self, screen, camera, offset=(0, 0)):
+        # Simplified drawing for when the map is zoomed out (through the camera, then moved by offset): just a line from end to end, so that chained elements make solid lines.
+        if self.end2_coordinates[0] is None: return
+        start = self.end1_coordinates if self.end1_coordinates[0] is not None else (self.x, self.y)
+        pygame.draw.line(screen, self.color, self.shifted(camera.world_to_view(*start), offset), self.shifted(camera.world_to_view(*self.end2_coordinates), offset),
+                         max(1, int(3*GAME_SPACE_SCALE_FACTOR*camera.zoom)))
+
+    @classmethod
+    def all_slots(cls) -> list:
+        return [name for klass in cls.__mro__ for name in getattr(klass, '__slots__', ())]
+
     def __getstate__(self):
-        state = self.__dict__.copy()
-        # Remove the pygame Surface objects before pickling
-        state['text'] = None
-        state['text_rect'] = None
-        return state
+        # the slots as a dict, like the __dict__ of the elements pickled by older versions
+        return {name: getattr(self, name) for name in self.all_slots() if hasattr(self, name)}
         
     def __setstate__(self, state):
-        self.__dict__.update(state)
-        # Recreate the text surface after unpickling
-        self.text = FONT_VERY_SMALL.render(f"{self.versor_x:.1f},{self.versor_y:.1f}", True, pygame.Color('white'))
-        self.text_rect = self.text.get_rect(center=(self.x, self.y-ELEMENT_SIZE//3))
-
+        # maps saved by older versions have the geometry and the debug text as plain attributes, which are not kept:
+        state = dict(state)
+        state.setdefault('_versor_x', state.get('versor_x', 0))
+        state.setdefault('_versor_y', state.get('versor_y', 0))
+        state.setdefault('scale_factor', 1)
+        for name in self.all_slots():
+            if name in state: setattr(self, name, state[name])
+        self.invalidate_geometry()
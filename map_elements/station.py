@@ -3,19 +3,25 @@ from .map_element import Map_element
 from game_config import *
 
 class Station(Map_element):
-    
-    def draw(self, screen):
+    __slots__ = ()
+
+    def draw(self, screen, offset=(0, 0)):
         
         station_scale_factor = self.scale_factor * 0.8 # specific factor for the below drawing which is bigg
         
         pygame.draw.rect(screen, self.color, 
-                        (int(self.x - self.size/2 * station_scale_factor), 
-                         int(self.y - self.size/2 * station_scale_factor),
+                        (int(self.x - self.size/2 * station_scale_factor) + offset[0], 
+                         int(self.y - self.size/2 * station_scale_factor) + offset[1],
                          int(self.size * station_scale_factor), int(self.size * station_scale_factor)))
         # Draw little roof triangle
         points = [(self.x - int(self.size/2 * station_scale_factor), int(self.y - self.size/2 * station_scale_factor)),
                  (self.x + int(self.size/2 * station_scale_factor), int(self.y - self.size/2 * station_scale_factor)),
                  (self.x, self.y - int(self.size * station_scale_factor))]
-        pygame.draw.polygon(screen, self.color, points)
-        super().draw(screen)
+        pygame.draw.polygon(screen, self.color, [self.shifted(point, offset) for point in points])
+        super().draw(screen, offset)
+
+    def draw_lod(self, screen, camera, offset=(0, 0)):
+        # zoomed out, just a box in the station's color
+        left, top = self.shifted(camera.world_to_view(self.x - self.size*0.4, self.y - self.size*0.4), offset)
+        screen.fill(self.color, (int(left), int(top), max(2, int(self.size*0.8*camera.zoom)), max(2, int(self.size*0.8*camera.zoom))))
 
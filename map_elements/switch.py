@@ -5,11 +5,12 @@ from game_config import *
 class Switch(Map_element):
     # this has additional attributes *_inactive. They are the alternative way the switch can connect if toggled, 
     #     case in which end2/end2_inactive and next_segment/next_segment_inactive will switch places.
+    __slots__ = ('_end2_inactive', 'next_segment_inactive')
+
     def __init__(self, *args, **kwargs):
         self._end2_inactive = 'D'
         self.next_segment_inactive = None
-        self.end2_inactive_coordinates = None
-        super().__init__(*args, **kwargs)  # this will also call recompute_end_coordinates (the overwritten below version)
+        super().__init__(*args, **kwargs)
 
     @property
     def end2_inactive(self): return self._end2_inactive
@@ -17,38 +18,30 @@ class Switch(Map_element):
     @end2_inactive.setter
     def end2_inactive(self, value): 
         self._end2_inactive = value
-        self.recompute_heading()
+        self.invalidate_geometry()
+
+    @property
+    def end2_inactive_coordinates(self): return self.end_coordinates(self._end2_inactive)
 
     def toggle(self):
         # Switch between the two possible mobile ends
         self._end2, self._end2_inactive = self._end2_inactive, self._end2
-        self.end2_coordinates, self.end2_inactive_coordinates = self.end2_inactive_coordinates, self.end2_coordinates
         self.next_segment, self.next_segment_inactive = self.next_segment_inactive, self.next_segment
-        self.recompute_heading() # needs to be called because end2 is changed, so we need to recalculate movement vector
-
-    def recompute_heading(self):
-        super().recompute_heading()
-        # besides the parent function which calculates coordinates and movement vectors, 
-        # we need to suplement with coordinates calculation for the switch specific end2_inactive, just for the drawing of it:
-        end_coordinates_map = {
-            'L': (self.x - self.size//2, self.y),
-            'R': (self.x + self.size//2, self.y),
-            'U': (self.x, self.y - self.size//2),
-            'D': (self.x, self.y + self.size//2),
-            None: (None, None)
-        }
-        self.end2_inactive_coordinates = end_coordinates_map[self._end2_inactive]
-
-
-    def draw(self, screen):
+        self.invalidate_geometry() # end2 is changed, so the movement vector will be recalculated when next needed
+
+
+    def draw(self, screen, offset=(0, 0)):
+        center = self.shifted((self.x, self.y), offset)
+        end1 = self.shifted(self.end1_coordinates, offset)
+        end2 = self.shifted(self.end2_coordinates, offset)
         # Draw a circle at the center of the switch
-        pygame.draw.circle(screen, pygame.Color(20, 160, 20), (self.x, self.y), self.size // 2)
-        pygame.draw.circle(screen, pygame.Color(20, 160, 20), (self.x, self.y), radius=self.size // 2)
-        pygame.draw.circle(screen, pygame.Color(180, 180, 180), (self.x, self.y), radius=self.size // 2, width=2*GAME_SPACE_SCALE_FACTOR)
+        pygame.draw.circle(screen, pygame.Color(20, 160, 20), center, self.size // 2)
+        pygame.draw.circle(screen, pygame.Color(20, 160, 20), center, radius=self.size // 2)
+        pygame.draw.circle(screen, pygame.Color(180, 180, 180), center, radius=self.size // 2, width=2*GAME_SPACE_SCALE_FACTOR)
         # Draw both paths, make the inactive one dimmer
-        pygame.draw.line(screen, self.color, self.end1_coordinates, self.end2_coordinates, 4*GAME_SPACE_SCALE_FACTOR)
-        pygame.draw.line(screen, pygame.Color(100, 100, 100), self.end1_coordinates, self.end2_inactive_coordinates, 4)
+        pygame.draw.line(screen, self.color, end1, end2, 4*GAME_SPACE_SCALE_FACTOR)
+        pygame.draw.line(screen, pygame.Color(100, 100, 100), end1, self.shifted(self.end2_inactive_coordinates, offset), 4)
         
         # small yellow circle to easily see end2:
-        pygame.draw.circle(screen, pygame.Color("yellow"), (self.end2_coordinates[0]*0.8+self.x*0.2 , self.end2_coordinates[1]*0.8+self.y*0.2), 5*GAME_SPACE_SCALE_FACTOR)
-        super().draw(screen)
\ No newline at end of file
+        pygame.draw.circle(screen, pygame.Color("yellow"), self.shifted((self.end2_coordinates[0]*0.8+self.x*0.2 , self.end2_coordinates[1]*0.8+self.y*0.2), offset), 5*GAME_SPACE_SCALE_FACTOR)
+        super().draw(screen, offset)
\ No newline at end of file
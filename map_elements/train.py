@@ -1,57 +1,33 @@
 import pygame
 import math
-from map_elements import *
 from game_config import *
+from .train_sprites import Train_sprites
 
-class Train(Map_element):
-    # Add static class variables
-    _base_image = None
-    
-    @classmethod
-    def load_assets(cls, size):
-        """Load the base train image once for all instances"""
-        try:
-            cls._base_image = pygame.image.load("assets/train.png").convert_alpha()
-            cls._base_image = pygame.transform.scale(cls._base_image, (size, size))
-        except:
-            print("Warning: Could not load train image. Trains will use simple drawing.")
-            cls._base_image = None
+class Train:
+    # A train is a view on one row of a Train_store, which holds the state of all trains in arrays and advances them all at once.
+    # The view exposes that row with the usual attribute names, and does the drawing.
+    size = ELEMENT_SIZE
+    __slots__ = ('store', 'index')
 
-    def __init__(self, x, y, color, current_tile:Map_element, train_status = Train_status.IN_BASE):
-        self.train_status = train_status
-        self.current_tile = current_tile
-        self.previous_tile = None
-        # for smooth movement and sub-pixel movement in case of small speeds:
-        self._x_float = float(x)
-        self._y_float = float(y)
-        super().__init__(x=x, y=y, color=color)
-        
-        if Train._base_image is None and USE_TRAIN_IMAGE:
-            # Load assets if not already loaded
-            Train.load_assets(self.size)
-            
-        if Train._base_image is not None:
-            # Create instance-specific tinted image
-            self.original_image = self._apply_color_tint(Train._base_image, self.color)
-            self.image = self.original_image
-        else:
-            self.original_image = None
-            self.image = None
+    def __init__(self, store, index:int):
+        self.store = store
+        self.index = index
 
     @property
     def x(self): 
-        return int(self._x_float)
+        return int(self.store.position(self.index)[0])
     @property
     def y(self): 
-        return int(self._y_float)
-
-    @x.setter
-    def x(self, value): 
-        self._x_float = float(value)
-        
-    @y.setter
-    def y(self, value): 
-        self._y_float = float(value)
+        return int(self.store.position(self.index)[1])
+    @property
+    def color(self):
+        return self.store.track_graph.colors[self.store.color[self.index]]
+    @property
+    def current_tile(self):
+        return self.store.track_graph.elements[self.store.node[self.index]]
+    @property
+    def train_status(self) -> Train_status:
+        return TRAIN_STATUSES[self.store.status[self.index]]
 
     def _get_angle_from_versors(self):
         # Calculate angle in degrees from versors
@@ -61,75 +37,6 @@ class Train(Map_element):
                                       self.current_tile.versor_x))
         return angle
 
-    def _apply_color_tint(self, surface, color):
-        # Create a copy of the original surface
-        tinted = surface.copy()
-        
-        # Create a color overlay
-        overlay = pygame.Surface(tinted.get_size(), pygame.SRCALPHA)
-        overlay.fill(color)
-        
-        # Blend the overlay with the original image, preserving alpha
-        for x in range(tinted.get_width()):
-            for y in range(tinted.get_height()):
-                original_color = tinted.get_at((x, y))
-                if original_color.a > 0:  # Only tint non-transparent pixels
-                    # Calculate new color based on original brightness
-                    brightness = (original_color.r + original_color.g + original_color.b) / (1 * 255) # normally should be 3* 255, I've lowered it for extra brightness
-                    new_color = pygame.Color(
-                        min(int(color[0] * brightness), 255),
-                        min(int(color[1] * brightness), 255),
-                        min(int(color[2] * brightness), 255),
-                        original_color.a
-                    )
-                    tinted.set_at((x, y), new_color)
-        
-        return tinted
-    
-    def advance(self) -> int:  # returns +1 if the train arrived in home station, -1 if in the wrong station, 0 otherwise
-
-        score_point = 0
-        
-        dx = self.current_tile.versor_x * TRAIN_SPEED
-        dy = self.current_tile.versor_y * TRAIN_SPEED
-
-        if (abs(dx) > 0 or abs(dy) > 0):
-            # check if a new move would lead us outside the tile:
-            if (abs(self._x_float - self.current_tile.end2_coordinates[0]) >= abs(dx)  and 
-                abs(self._y_float - self.current_tile.end2_coordinates[1]) >= abs(dy)):
-                self._x_float += dx
-                self._y_float += dy
-            else: # a new move would lead us outside the tile, so switch to next tile if it exists:
-                if self.current_tile.next_segment:
-                    self.current_tile = self.current_tile.next_segment
-                    if isinstance(self.current_tile, Station): 
-                        if self.current_tile.color == self.color:
-                            self.train_status = Train_status.IN_HOME_STATION
-                            score_point = 1
-                        else:
-                            self.train_status = Train_status.IN_WRONG_STATION
-                            score_point = -1
-                    else: # next segment exists and is not Station, so move at the beginning of it:
-                        self._x_float = float(self.current_tile.end1_coordinates[0])
-                        self._y_float = float(self.current_tile.end1_coordinates[1])
-                else: # no next segment exists:
-                    self.train_status = Train_status.STRANDED
-        else: # dx and dy are both 0, probably because the base station is unconnected, or an unexpected call of this function:
-            self.train_status = Train_status.STRANDED
-
-        return score_point        
-
-
-    def draw_simple(self, screen):
-        # Main circle (marble-like)
-        pygame.draw.circle(screen, self.color, (self.x, self.y), self.size//3)
-        # Shine effect (small white circle in upper-left)
-        shine_offset = self.size//8
-        pygame.draw.circle(screen, (255, 255, 255), 
-                         (self.x - shine_offset, self.y - shine_offset), 
-                         self.size//8)
-        
-    
     def draw_complex(self, screen):
         pygame.draw.rect(screen, self.color, # Draw main body (rectangle)
                         (self.x - self.size//2, # left
@@ -150,15 +57,18 @@ class Train(Map_element):
                           wheel_radius)
         
 
-    def draw(self, screen):
-        if self.image:
-            # Rotate image based on movement direction
-            angle = self._get_angle_from_versors()
-            self.image = pygame.transform.rotate(self.original_image, angle)
-            # Calculate position to center the image on the train's coordinates
-            image_rect = self.image.get_rect(center=(self.x, self.y))
-            screen.blit(self.image, image_rect)
-        else:
-            # Fallback to simple drawing if image loading failed
-            self.draw_simple(screen)
+    def sprite(self, camera=None, position=None) -> tuple[pygame.Surface, pygame.Rect]:
+        """The cached picture of the train and where to blit it, e.g. for drawing all trains with a single Surface.blits() call.
+        position: where to draw it (map pixel coordinates) if not where the train is, e.g. interpolated between simulation ticks."""
+        image = Train_sprites.get(self.color, self._get_angle_from_versors(), self.size)
+        x, y = position if position is not None else self.store.position(self.index)
+        if camera: x, y = camera.world_to_screen(x, y)
+        return image, image.get_rect(center=(int(x), int(y)))
+
+    def draw(self, screen, camera=None, position=None) -> pygame.Rect: # returns the area drawn over
+        return screen.blit(*self.sprite(camera, position))
 
+    def draw_dot(self, screen, camera, position=None) -> pygame.Rect:
+        # zoomed out, the train is just a dot of its color
+        if position is None: position = self.store.position(self.index)
+        return pygame.draw.circle(screen, self.color, camera.world_to_screen(*position), max(2, int(self.size * camera.zoom) // 4))
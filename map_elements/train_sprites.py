@@ -0,0 +1,67 @@
+import math
+import numpy as np
+import pygame
+
+from game_config import *
+from resources import resources
+
+TRACK_HEADINGS = (0, 90, 180, -90, 45, 135, -135, -45)  # the headings trains can have on straight and curved tracks
+
+
+class Train_sprites:
+    # Cache of ready-to-blit train pictures, keyed by (color, heading, size), shared by all trains.
+    # With USE_TRAIN_IMAGE the picture is the train image tinted in the train's color and rotated to its heading,
+    #     otherwise it's the simple marble (for which the heading doesn't matter).
+    # Tinting is done on the whole pixel array at once with NumPy, and each picture is made only once, instead of at every train spawn and every frame.
+    _cache = {}
+
+    @classmethod
+    def base_image(cls, size):
+        """The train image scaled to size, loaded once for all instances. None if it could not be loaded, the trains then use simple drawing."""
+        return resources.image(TRAIN_IMAGE_FILE, (size, size))
+
+    @staticmethod
+    def tint(surface, color):
+        tinted = surface.copy()
+        rgb = pygame.surfarray.pixels3d(tinted)
+        alpha = pygame.surfarray.pixels_alpha(tinted)
+        # Calculate new color based on original brightness, only for the non-transparent pixels
+        brightness = rgb.sum(axis=2) / (1 * 255) # normally should be 3* 255, I've lowered it for extra brightness
+        opaque = alpha > 0
+        for channel in range(3):
+            rgb[..., channel][opaque] = np.minimum((color[channel] * brightness[opaque]).astype(np.int64), 255)
+        del rgb, alpha  # unlocks the surface
+        return tinted
+
+    @staticmethod
+    def marble(color, size):
+        radius = size//3
+        marble = pygame.Surface((2 * radius + 2, 2 * radius + 2), pygame.SRCALPHA)
+        center = radius + 1
+        # Main circle (marble-like)
+        pygame.draw.circle(marble, color, (center, center), radius)
+        # Shine effect (small white circle in upper-left)
+        shine_offset = size//8
+        pygame.draw.circle(marble, (255, 255, 255), (center - shine_offset, center - shine_offset), size//8)
+        return marble
+
+    @classmethod
+    def get(cls, color, heading, size=ELEMENT_SIZE):
+        """The picture of a train of the given color, heading (degrees, counterclockwise from the right) and size."""
+        image = cls.base_image(size) if USE_TRAIN_IMAGE else None
+        key = (tuple(color), round(heading) if image else None, size)
+        sprite = cls._cache.get(key)
+        if sprite is None:
+            if image:
+                sprite = pygame.transform.rotate(cls.tint(image, color), round(heading))
+            else:
+                sprite = cls.marble(color, size)
+            cls._cache[key] = sprite
+        return sprite
+
+    @classmethod
+    def prewarm(cls, colors, size=ELEMENT_SIZE):
+        """Make the pictures of all the colors and track headings in advance (needs the display to be set up), so spawning trains never hitches."""
+        for color in colors:
+            for heading in TRACK_HEADINGS:
+                cls.get(color, heading, size)
@@ -0,0 +1,154 @@
+import numpy as np
+
+from .train import Train
+from game_config import *
+from game_utils import Utils
+
+STATUS_CODE = {status: code for code, status in enumerate(TRAIN_STATUSES)}
+IN_BASE = STATUS_CODE[Train_status.IN_BASE]
+EN_ROUTE = STATUS_CODE[Train_status.EN_ROUTE]
+STRANDED = STATUS_CODE[Train_status.STRANDED]
+IN_HOME_STATION = STATUS_CODE[Train_status.IN_HOME_STATION]
+IN_WRONG_STATION = STATUS_CODE[Train_status.IN_WRONG_STATION]
+NO_NODE = -1  # same as in the track graph
+
+
+class Train_log:
+    # The trains which are done (arrived in a station, or stranded), one row per train in a few arrays: its color, when it spawned and ended, and how.
+    # It's what's left of a train once it's retired from the Train_store, some bytes instead of a live row and a Train object.
+    def __init__(self, capacity=64):
+        self.count = 0
+        self.color = np.zeros(capacity, dtype=np.int16)  # index in track_graph.colors
+        self.spawn_tick = np.zeros(capacity, dtype=np.int64)
+        self.end_tick = np.zeros(capacity, dtype=np.int64)
+        self.outcome = np.zeros(capacity, dtype=np.int8)  # index in TRAIN_STATUSES
+
+    def __len__(self): return self.count
+
+    def append(self, color, spawn_tick, end_tick:int, outcome):
+        end = self.count + len(color)
+        for name in ('color', 'spawn_tick', 'end_tick', 'outcome'):
+            setattr(self, name, Utils.grow(getattr(self, name), end))
+        self.color[self.count:end] = color
+        self.spawn_tick[self.count:end] = spawn_tick
+        self.end_tick[self.count:end] = end_tick
+        self.outcome[self.count:end] = outcome
+        self.count = end
+
+
+class Train_store:
+    # Holds the state of all the trains of a game as a structure of arrays (one NumPy array per attribute, one row per train),
+    #     so that all trains can be advanced together with a few vectorized operations instead of a Python method call per train per frame.
+    # Trains travel on a compiled Track_graph: a train is just (node id, distance travelled along the node), its pixel position is derived from that when needed.
+    # Only the few trains which reach the end of their node in a given frame are handled one by one, with a successor lookup.
+    # Train objects are just views on a row of the store, used for drawing.
+    # Only the trains on the tracks have a row: the trains arriving in a station are retired to the log, their row dropped (the rows after it move up one)
+    #     and their Train object put back in a pool, for a next train. So is a stranded train, when another one of the same color is already stranded
+    #     at the same place (it would be drawn over it). The cost of a tick follows the trains on the tracks, not all the trains of the game.
+    # The number of trains per status, retired ones included, is kept up to date as they change.
+    def __init__(self, track_graph, capacity=64):
+        self.track_graph = track_graph
+        self.count = 0
+        self.node = np.zeros(capacity, dtype=np.int32)  # id of the current tile in the track graph
+        self.distance = np.zeros(capacity)  # distance travelled along the current tile
+        self.color = np.zeros(capacity, dtype=np.int16)  # index in track_graph.colors
+        self.status = np.zeros(capacity, dtype=np.int8)  # index in TRAIN_STATUSES
+        self.spawn_tick = np.zeros(capacity, dtype=np.int64)
+        self.views = []  # the Train views, one per row
+        self.pool = []  # Train views of retired trains, for reuse
+        self.status_counts = np.zeros(len(TRAIN_STATUSES), dtype=np.int64)
+        self.log = Train_log()
+        self.compactions = 0  # how many times rows moved (their indexes changed), for those who keep row indexes (see Event_scheduler)
+
+    def __len__(self): return self.count
+
+    def spawn(self, color, current_tile, train_status=Train_status.IN_BASE, tick:int=0) -> Train:
+        index = self.count
+        self.count += 1
+        for name in ('node', 'distance', 'color', 'status', 'spawn_tick'):
+            setattr(self, name, Utils.grow(getattr(self, name), self.count))
+        self.node[index] = self.track_graph.node_id(current_tile)
+        self.track_graph.sync()  # in case the tile was not compiled yet
+        self.distance[index] = 0
+        self.color[index] = self.track_graph.color_id(color)
+        self.status[index] = STATUS_CODE[train_status]
+        self.spawn_tick[index] = tick
+        self.status_counts[STATUS_CODE[train_status]] += 1
+        train = self.pool.pop() if self.pool else Train(self, index)
+        train.index = index
+        self.views.append(train)
+        return train
+
+    def position(self, index) -> tuple[float, float]:
+        x, y = self.track_graph.positions(self.node[index], self.distance[index])
+        return float(x), float(y)
+
+    def count_status(self, train_status) -> int:
+        return int(self.status_counts[STATUS_CODE[train_status]])
+
+    def set_status(self, indexes, status_code:int):
+        if len(indexes) == 0: return
+        np.subtract.at(self.status_counts, self.status[indexes], 1)
+        self.status[indexes] = status_code
+        self.status_counts[status_code] += len(indexes)
+
+    def advance(self, tick:int=0) -> tuple[int, int]:
+        """Advance all the moving trains by one tick (the given one). Returns the points scored: (arrived in home station, arrived in a wrong station)."""
+        graph = self.track_graph
+        n = self.count
+        node, distance, status = self.node[:n], self.distance[:n], self.status[:n]
+        active = (status == EN_ROUTE) | (status == IN_BASE)
+        # trains which can't move at all, probably because the base station is unconnected:
+        stalled = active & graph.is_stalled(node)
+        stalled = np.flatnonzero(stalled) if stalled.any() else []
+        self.set_status(stalled, STRANDED)
+        moving = active & (status != STRANDED)
+
+        # a move is done only if it would not lead us beyond the end of the tile:
+        leaving = moving & (distance + TRAIN_SPEED > graph.length[node])
+        distance[moving & ~leaving] += TRAIN_SPEED
+
+        # the others switch to the next tile, if it exists:
+        stranded, in_home, in_wrong = [], [], []  # the trains which end their journey on this tick
+        for index in np.flatnonzero(leaving):
+            next_node = graph.successor[node[index]]
+            if next_node == NO_NODE:
+                stranded.append(index)
+                continue
+            # move at the beginning of the next segment (or stay in the station if we arrived in one):
+            node[index] = next_node
+            distance[index] = 0
+            station_color = graph.station_color[next_node]
+            if station_color >= 0:
+                if station_color == self.color[index]: in_home.append(index)
+                else: in_wrong.append(index)
+
+        self.set_status(stranded, STRANDED)
+        self.set_status(in_home, IN_HOME_STATION)
+        self.set_status(in_wrong, IN_WRONG_STATION)
+        done = list(stalled) + stranded + in_home + in_wrong
+        if done: self.retire(done, tick)
+        return len(in_home), len(in_wrong)
+
+    def retire(self, indexes:list, tick:int):
+        # The trains in a station, and the stranded ones which would be drawn over another, go to the log. Their rows are dropped, keeping the order of the others.
+        n = self.count
+        keep = np.ones(n, dtype=bool)
+        for index in sorted(indexes):
+            keep[index] = False
+            if self.status[index] == STRANDED:  # kept, unless another one stays there
+                keep[index] = not np.any(keep & (self.status[:n] == STRANDED) & (self.node[:n] == self.node[index])
+                                         & (self.color[:n] == self.color[index]) & (self.distance[:n] == self.distance[index]))
+        retired = np.flatnonzero(~keep)
+        if len(retired) == 0: return
+        self.log.append(self.color[retired], self.spawn_tick[retired], tick, self.status[retired])
+        kept = int(keep.sum())
+        for name in ('node', 'distance', 'color', 'status', 'spawn_tick'):
+            array = getattr(self, name)
+            array[:kept] = array[:n][keep]
+        self.pool.extend(self.views[index] for index in retired)
+        self.views = [view for view, kept_view in zip(self.views, keep) if kept_view]
+        for index in range(retired[0], kept):
+            self.views[index].index = index
+        self.count = kept
+        self.compactions += 1
@@ -0,0 +1,194 @@
+import os
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')  # headless, e.g. on build servers
+import argparse
+import concurrent.futures
+import json
+import random
+import numpy as np
+
+from map import *
+from simulation import Simulation
+from track_graph import Track_graph, NO_NODE
+from map_elements.train_store import IN_BASE, EN_ROUTE, IN_HOME_STATION, IN_WRONG_STATION
+import map_io
+
+# Rating the difficulty of a map: it is played headlessly many times, with different random seeds and switch policies (how the "player" toggles the switches),
+#     and the results are collected: score distributions, the rate of stranded trains and a histogram of the time trains take to reach a station.
+#     python map_evaluator.py map.json [--runs 1000] [--ticks 4000] [--policies none random greedy] [--workers 8]
+# The runs go to a pool of worker processes. Each worker builds the map (and compiles its track graph) once, when it starts,
+#     and plays all its runs on it, the map being put back as it was after each run: the tasks sent to the workers are just (policy, seed).
+# The statistics are aggregated in this process as the runs complete, and reported while the others are still running.
+EVALUATION_TICKS = 4000  # ticks played per run, 100 seconds of game time
+HISTOGRAM_BIN_SECONDS = 5  # width of the bins of the time to station histogram
+RANDOM_TOGGLE_PROBABILITY = 1 / SIMULATION_TICK_RATE  # random policy: chance per tick of toggling a (random) switch, so about once per second
+FINISHED = (IN_HOME_STATION, IN_WRONG_STATION)
+
+
+def reachable_colors(map:Map, track_graph:Track_graph) -> list:
+    """For every node of the track graph, the (ids of the) colors of the stations reachable from it, whatever the switches' positions."""
+    reach = [set() for _ in range(len(track_graph))]
+    for station in map.stations:
+        color = track_graph.color_id(station.color)
+        element, seen = station, set()
+        while element is not None and element not in seen:  # up to the base station (a chain could also loop)
+            seen.add(element)
+            reach[track_graph.node_id(element)].add(color)
+            element = element.previous_segment
+    track_graph.sync()
+    return reach
+
+
+# Switch policies, called before each tick with the simulation, the random generator of the run and the reachable colors:
+def no_toggles(simulation:Simulation, rng:random.Random, reach:list):
+    pass
+
+
+def random_toggles(simulation:Simulation, rng:random.Random, reach:list):
+    # a player clicking without looking
+    if rng.random() < RANDOM_TOGGLE_PROBABILITY:
+        switches = [element for element in simulation.track_graph.elements if isinstance(element, Switch)]
+        if switches: simulation.toggle_switch(rng.choice(switches))
+
+
+def greedy_toggles(simulation:Simulation, rng:random.Random, reach:list):
+    # a perfect player: just before a train leaves a switch, the switch is set towards a branch where the train's station is, if there is one
+    store, graph = simulation.train_store, simulation.track_graph
+    n = store.count
+    node, status = store.node[:n], store.status[:n]
+    leaving = np.flatnonzero(((status == EN_ROUTE) | (status == IN_BASE)) & (graph.successor_inactive[node] != NO_NODE)
+                             & (store.distance[:n] + TRAIN_SPEED > graph.length[node]))
+    for index in leaving:
+        switch_node, color = node[index], store.color[index]
+        active, inactive = graph.successor[switch_node], graph.successor_inactive[switch_node]
+        if (active == NO_NODE or color not in reach[active]) and color in reach[inactive]:
+            simulation.toggle_switch(graph.elements[switch_node])
+            graph.sync()
+
+
+SWITCH_POLICIES = {'none': no_toggles, 'random': random_toggles, 'greedy': greedy_toggles}
+
+
+class Evaluation_worker:
+    # The map of a worker process, built once and played again and again.
+    def __init__(self, map_data:dict):
+        map = map_io.map_from_data(map_data)
+        self.simulation = Simulation(map)
+        self.reach = reachable_colors(map, self.simulation.track_graph)
+        self.switches = [(element, element.next_segment) for element in map.map_elements.values() if isinstance(element, Switch)]  # as they were set
+
+    def run(self, policy:str, seed:int, ticks:int) -> dict:
+        simulation, policy_function = self.simulation, SWITCH_POLICIES[policy]
+        rng = random.Random(seed)
+        simulation.reset(seed)
+        for _ in range(ticks):
+            policy_function(simulation, rng, self.reach)
+            simulation.update()
+        # the trains which reached a station are in the log of the retired trains, with when they spawned and arrived:
+        store, log = simulation.train_store, simulation.train_store.log
+        arrived = np.isin(log.outcome[:log.count], FINISHED)
+        arrival_ticks = log.end_tick[:log.count][arrived] + 1 - log.spawn_tick[:log.count][arrived]
+        result = {'policy': policy, 'seed': seed, 'score_ok': simulation.score_ok, 'score_nok': simulation.score_nok,
+                  'spawned': int(store.status_counts.sum()), 'stranded': store.count_status(Train_status.STRANDED),
+                  'arrival_histogram': np.bincount(arrival_ticks // (HISTOGRAM_BIN_SECONDS * SIMULATION_TICK_RATE)).tolist()}
+        # back to the map as it was, for the next run:
+        for switch, next_segment in self.switches:
+            if switch.next_segment is not next_segment: simulation.toggle_switch(switch)
+        return result
+
+
+worker = None  # the Evaluation_worker of this process, made by init_worker when the process starts
+
+
+def init_worker(map_data:dict):
+    global worker
+    worker = Evaluation_worker(map_data)
+
+
+def run_in_worker(policy:str, seed:int, ticks:int) -> dict:
+    return worker.run(policy, seed, ticks)
+
+
+class Evaluation_stats:
+    # The results of the runs of one switch policy, aggregated as they arrive.
+    def __init__(self, policy:str):
+        self.policy = policy
+        self.score_ok = []
+        self.score_nok = []
+        self.spawned = 0
+        self.stranded = 0
+        self.arrival_histogram = np.zeros(0, dtype=np.int64)
+
+    def add(self, result:dict):
+        self.score_ok.append(result['score_ok'])
+        self.score_nok.append(result['score_nok'])
+        self.spawned += result['spawned']
+        self.stranded += result['stranded']
+        histogram = np.array(result['arrival_histogram'], dtype=np.int64)
+        if len(histogram) > len(self.arrival_histogram):
+            self.arrival_histogram = np.concatenate((self.arrival_histogram, np.zeros(len(histogram) - len(self.arrival_histogram), dtype=np.int64)))
+        self.arrival_histogram[:len(histogram)] += histogram
+
+    @staticmethod
+    def distribution(values:list) -> dict:
+        values = np.array(values)
+        p10, p50, p90 = np.percentile(values, (10, 50, 90))
+        return {'mean': float(values.mean()), 'std': float(values.std()), 'min': int(values.min()), 'p10': float(p10), 'p50': float(p50), 'p90': float(p90), 'max': int(values.max())}
+
+    def summary(self) -> dict:
+        return {'policy': self.policy, 'runs': len(self.score_ok),
+                'score_ok': self.distribution(self.score_ok), 'score_nok': self.distribution(self.score_nok),
+                'stranded_rate': self.stranded / self.spawned if self.spawned else 0.0,
+                'time_to_station_histogram': {f"{index * HISTOGRAM_BIN_SECONDS}-{(index + 1) * HISTOGRAM_BIN_SECONDS}s": int(count)
+                                              for index, count in enumerate(self.arrival_histogram) if count}}
+
+
+def evaluate(map_data:dict, runs:int, policies=tuple(SWITCH_POLICIES), ticks:int=EVALUATION_TICKS, workers:int=None, first_seed:int=0):
+    """Play the map runs times with each policy (seeds first_seed, first_seed + 1...) on a pool of worker processes.
+    Yields the statistics of all the policies, as a dict policy -> Evaluation_stats, each time a run completes."""
+    stats = {policy: Evaluation_stats(policy) for policy in policies}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(map_data,)) as executor:
+        futures = [executor.submit(run_in_worker, policy, seed, ticks) for seed in range(first_seed, first_seed + runs) for policy in policies]
+        for future in concurrent.futures.as_completed(futures):
+            result = future.result()
+            stats[result['policy']].add(result)
+            yield stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rate a map by playing it many times headlessly")
+    parser.add_argument('map_file')
+    parser.add_argument('--runs', type=int, default=1000, help="runs per policy, each with its own seed")
+    parser.add_argument('--ticks', type=int, default=EVALUATION_TICKS, help="ticks per run")
+    parser.add_argument('--policies', nargs='+', choices=sorted(SWITCH_POLICIES), default=list(SWITCH_POLICIES))
+    parser.add_argument('--workers', type=int, default=None, help="worker processes, by default one per CPU")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the first run")
+    parser.add_argument('--report-every', type=int, default=100, help="print the statistics every that many runs")
+    parser.add_argument('--json', help="write the final statistics to this file")
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    map_data = map_io.read_map_data(args.map_file)
+    map_io.map_from_data(map_data)  # a broken map fails here, not in every worker
+    total = args.runs * len(args.policies)
+    completed = 0
+    stats = {}
+    for stats in evaluate(map_data, args.runs, args.policies, args.ticks, args.workers, args.seed):
+        completed += 1
+        if completed % args.report_every == 0 or completed == total:
+            print(f"{completed}/{total} runs")
+            for policy_stats in stats.values():
+                if not policy_stats.score_ok: continue
+                summary = policy_stats.summary()
+                print(f"    {summary['policy']:<8} ok {summary['score_ok']['mean']:6.2f} (p10 {summary['score_ok']['p10']:.0f}, p90 {summary['score_ok']['p90']:.0f})"
+                      f"  nok {summary['score_nok']['mean']:6.2f}  stranded {summary['stranded_rate']:6.1%}")
+    summaries = [policy_stats.summary() for policy_stats in stats.values()]
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summaries, f, indent=4)
+    else:
+        for summary in summaries:
+            print(json.dumps(summary))
+
+
+if __name__ == "__main__":
+    main()
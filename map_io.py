@@ -0,0 +1,182 @@
+import io
+import json
+import os
+import pickle
+import sys
+
+from map import *
+
+# Map files: a small JSON document with the map size and one record per occupied tile:
+#     {"x": 3, "y": 1, "type": "switch", "ends": "LRD", "color": "#ffffff", "prev": [2, 1], "next": [4, 1], "next_inactive": [3, 2]}
+# "ends" are the end1, end2 (and end2_inactive for switches) letters, "-" for an unset end. The links to the neighbor elements
+#     (previous_segment, next_segment, next_segment_inactive) are stored as the tiles of those elements, so there is no recursion
+#     along the track chains, neither when writing nor when reading. Pixel coordinates are not stored: they follow from the tile and ELEMENT_SIZE.
+# Reading is a single pass over the records, links to tiles which come later in the file being completed when those tiles are read.
+# Reading parses plain data only, it never executes code from the file (unlike pickle). Maps saved with pickle by older versions are migrated,
+#     see load_legacy_pickle.
+MAP_FILE_FORMAT = "trains-map"
+MAP_FILE_VERSION = 1  # increase when the format changes, and convert the older versions in map_from_data
+MAP_FILE_EXTENSION = ".json"
+ELEMENT_TYPES = {'track': Track_segment, 'switch': Switch, 'station': Station, 'base': Base_station}
+ELEMENT_TYPE_NAMES = {element_class: name for name, element_class in ELEMENT_TYPES.items()}
+LEGACY_TYPE_NAMES = {'Track_segment': 'track', 'Switch': 'switch', 'Station': 'station', 'Base_station': 'base'}
+LINKS = {'prev': 'previous_segment', 'next': 'next_segment', 'next_inactive': 'next_segment_inactive'}
+
+
+def color_to_hex(color) -> str:
+    return '#%02x%02x%02x' % tuple(color[:3])
+
+
+def ends_to_text(ends) -> str:
+    return ''.join(end if end else '-' for end in ends)
+
+
+def map_to_data(map:Map) -> dict:
+    """The map as plain data (dicts, lists, strings and numbers), ready to be written as JSON."""
+    tiles = {element: (tile_x, tile_y) for tile_x, tile_y, element in map.map_elements.items()}
+    records = []
+    for element, (tile_x, tile_y) in tiles.items():
+        ends = (element.end1, element.end2, element.end2_inactive) if isinstance(element, Switch) else (element.end1, element.end2)
+        record = {'x': tile_x, 'y': tile_y, 'type': ELEMENT_TYPE_NAMES[type(element)], 'ends': ends_to_text(ends), 'color': color_to_hex(element.color)}
+        for key, attribute in LINKS.items():
+            linked = getattr(element, attribute, None)
+            if linked is not None and linked in tiles: record[key] = list(tiles[linked])
+        records.append(record)
+    return {'format': MAP_FILE_FORMAT, 'version': MAP_FILE_VERSION,
+            'width': map.width, 'height': map.height,
+            'stations': [list(tiles[station]) for station in map.stations if station in tiles],  # in order, as they get picked by it when spawning trains
+            'tiles': records}
+
+
+def map_from_data(data:dict) -> Map:
+    """Build a Map from the plain data read from a map file. Raises ValueError if the data is not a valid map."""
+    if not isinstance(data, dict) or data.get('format') != MAP_FILE_FORMAT:
+        raise ValueError("Not a map file")
+    if not isinstance(data.get('version'), int) or data['version'] > MAP_FILE_VERSION:
+        raise ValueError(f"Map file version {data.get('version')} is not supported, please update the game")
+    try:
+        map = Map(int(data['width']), int(data['height']))
+        waiting = {}  # tile -> [(element, link attribute)] of the elements linking to that tile, not read yet
+        colors = {}  # one Color object per color, shared by the elements, not one per element
+        for record in data['tiles']:
+            tile = (int(record['x']), int(record['y']))
+            if not map.map_elements.in_bounds(*tile) or map.map_elements[tile] is not None:
+                raise ValueError(f"Invalid or repeated tile {tile}")
+            element = ELEMENT_TYPES[record['type']](tile[0] * ELEMENT_SIZE + ELEMENT_SIZE//2, tile[1] * ELEMENT_SIZE + ELEMENT_SIZE//2)
+            ends = [None if end == '-' else end for end in record['ends']]
+            if any(end not in ('L', 'R', 'U', 'D', None) for end in ends): raise ValueError(f"Invalid ends {record['ends']}")
+            element.end1, element.end2 = ends[0], ends[1]
+            if isinstance(element, Switch): element.end2_inactive = ends[2]
+            if record['color'] not in colors: colors[record['color']] = pygame.Color(record['color'])
+            element.color = colors[record['color']]
+            map.map_elements[tile] = element
+            # links to the tiles already read are made right away, the others when their tile comes:
+            for key, attribute in LINKS.items():
+                if key in record:
+                    linked_tile = (int(record[key][0]), int(record[key][1]))
+                    linked = map.map_elements.get(*linked_tile)
+                    if linked is not None: setattr(element, attribute, linked)
+                    else: waiting.setdefault(linked_tile, []).append((element, attribute))
+            for linking_element, attribute in waiting.pop(tile, ()):
+                setattr(linking_element, attribute, element)
+            if isinstance(element, Base_station):
+                map.base_station = element
+                map.base_station_tile_position = tile
+        if waiting: raise ValueError(f"Links to empty tiles: {sorted(waiting)}")
+        map.stations = [map.map_elements.get(int(x), int(y)) for x, y in data['stations']]
+        if not all(isinstance(station, Station) for station in map.stations): raise ValueError("Invalid station tiles")
+    except (KeyError, IndexError, TypeError) as e:
+        raise ValueError(f"Invalid map file ({type(e).__name__}: {e})") from e
+    return map
+
+
+def save_map(map:Map, filename:str, **extra):
+    # extra: additional top level keys to store along the map (readers ignore the keys they don't know)
+    save_map_data(map_to_data(map), filename, **extra)
+
+
+def save_map_data(data:dict, filename:str, **extra):
+    # the map already as plain data (see map_to_data), e.g. taken in the game loop and written on another thread
+    # written to a temporary file first, so an interrupted save doesn't destroy the previous one
+    temporary_filename = filename + '.tmp'
+    with open(temporary_filename, 'w') as f:
+        json.dump({**data, **extra}, f, separators=(',', ':'))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary_filename, filename)
+
+
+def read_map_data(filename:str) -> dict:
+    """The plain data of a map file (see map_from_data). Maps pickled by older versions are recognized and migrated."""
+    with open(filename, 'rb') as f:
+        content = f.read()
+    if content[:1] == b'\x80':  # the pickle protocol marker
+        return load_legacy_pickle(content)
+    return json.loads(content)
+
+
+def load_map(filename:str) -> Map:
+    """Read a map file. Maps pickled by older versions are recognized and migrated."""
+    return map_from_data(read_map_data(filename))
+
+
+class Legacy_object:
+    # Stand-in for the classes found in old pickles: it just keeps the pickled attributes, no code of the game classes runs while unpickling.
+    class_name = None
+    state = {}
+
+    def __setstate__(self, state):
+        self.state = state
+
+
+class Legacy_unpickler(pickle.Unpickler):
+    # Only the classes which were ever pickled in map files are allowed, everything else (e.g. os.system) is refused.
+    LEGACY_CLASSES = {('map', 'Map'), ('tile_grid', 'Tile_grid'),
+                      ('map_elements.track_segment', 'Track_segment'), ('map_elements.switch', 'Switch'),
+                      ('map_elements.station', 'Station'), ('map_elements.base_station', 'Base_station')}
+
+    def find_class(self, module, name):
+        if (module, name) in Legacy_unpickler.LEGACY_CLASSES:
+            return type(name, (Legacy_object,), {'class_name': name})
+        if module == 'pygame' and name == '__color_constructor':
+            return lambda *rgba: tuple(rgba)
+        raise pickle.UnpicklingError(f"Refusing to load {module}.{name} from a map file")
+
+
+def load_legacy_pickle(content:bytes) -> dict:
+    """Convert a map pickled by older versions (with a dense list of columns, or a Tile_grid) to the plain data of the map file format."""
+    map = Legacy_unpickler(io.BytesIO(content)).load()
+    if not isinstance(map, Legacy_object) or map.class_name != 'Map':
+        raise ValueError("Not a map file")
+    grid = map.state['map_elements']
+    if isinstance(grid, list):
+        width, height = len(grid), len(grid[0]) if grid else 0
+        cells = [(tile_x, tile_y, element) for tile_x, column in enumerate(grid) for tile_y, element in enumerate(column) if element is not None]
+    else:
+        width, height, size = grid.state['width'], grid.state['height'], grid.state['chunk_size']
+        cells = [(chunk_x * size + index % size, chunk_y * size + index // size, element)
+                 for (chunk_x, chunk_y), chunk in grid.state['chunks'].items() for index, element in enumerate(chunk) if element is not None]
+    # the tiles come from the grid, not from the pickled pixel coordinates, which depend on the ELEMENT_SIZE of the machine which saved them
+    tiles = {id(element): (tile_x, tile_y) for tile_x, tile_y, element in cells}
+    records = []
+    for tile_x, tile_y, element in cells:
+        state = element.state
+        ends = (state.get('_end1'), state.get('_end2'))
+        if element.class_name == 'Switch': ends += (state.get('_end2_inactive'),)
+        record = {'x': tile_x, 'y': tile_y, 'type': LEGACY_TYPE_NAMES[element.class_name], 'ends': ends_to_text(ends), 'color': color_to_hex(state['color'])}
+        for key, attribute in LINKS.items():
+            linked = state.get(attribute)
+            if linked is not None and id(linked) in tiles: record[key] = list(tiles[id(linked)])
+        records.append(record)
+    return {'format': MAP_FILE_FORMAT, 'version': MAP_FILE_VERSION, 'width': width, 'height': height,
+            'stations': [list(tiles[id(station)]) for station in map.state['stations'] if id(station) in tiles],
+            'tiles': records}
+
+
+if __name__ == "__main__":
+    # Migration of old pickled maps: python map_io.py map.pkl [other.pkl ...] writes map.json etc. next to them
+    configure_logging()
+    for legacy_filename in sys.argv[1:]:
+        filename = os.path.splitext(legacy_filename)[0] + MAP_FILE_EXTENSION
+        save_map(load_map(legacy_filename), filename)
+        print(f"{legacy_filename} -> {filename}")
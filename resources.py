@@ -0,0 +1,50 @@
+from collections import OrderedDict
+import pygame
+from game_config import *
+
+# The fonts, images and rendered texts of the user interface, made the first time they are needed, and shared by everyone needing the same one:
+#     one Font per text size for all the buttons, one picture per image and size, one Surface per text shown again and again (button labels, debug labels).
+# The rendered texts are kept in a least recently used cache of TEXT_CACHE_SIZE entries, keyed by (font size, text, color, antialias)
+#     (there is one font per size), so the labels in use stay rendered whatever else gets rendered meanwhile (e.g. scores, every one of them once).
+# Nothing is loaded when the module is imported, so the headless tools (benchmark, map evaluator workers, replays) never pay for fonts or images,
+#     and neither does the start of the game, before its first frame.
+
+
+class Resources:
+    def __init__(self):
+        self.fonts = {}  # size -> Font
+        self.images = {}  # (file name, size) -> Surface, None if it could not be loaded
+        self.texts = OrderedDict()  # (size, text, color, antialias) -> the rendered text, the least recently used first
+
+    def font(self, size:int) -> pygame.font.Font:
+        font = self.fonts.get(size)
+        if font is None:
+            if not pygame.font.get_init(): pygame.font.init()  # e.g. drawing headlessly, without Game having initialized pygame
+            font = self.fonts[size] = pygame.font.Font(None, size)
+        return font
+
+    def image(self, filename:str, size:tuple=None):
+        """The image, scaled to size (width, height) if given, converted for fast blitting (needs the display to be set up). None if it can't be loaded."""
+        key = (filename, size)
+        if key not in self.images:
+            try:
+                image = pygame.image.load(filename).convert_alpha()
+                self.images[key] = pygame.transform.scale(image, size) if size else image
+            except (pygame.error, OSError) as e:
+                game_logger.warning("Could not load image %s: %s", filename, e)
+                self.images[key] = None
+        return self.images[key]
+
+    def text(self, text:str, size:int, color, antialias:bool=True) -> pygame.Surface:
+        """The text rendered in the given size and color. Don't modify the Surface, it's shared."""
+        key = (size, text, tuple(color), antialias)
+        surface = self.texts.get(key)
+        if surface is None:
+            if len(self.texts) >= TEXT_CACHE_SIZE: self.texts.popitem(last=False)
+            surface = self.texts[key] = self.font(size).render(text, antialias, color)
+        else:
+            self.texts.move_to_end(key)
+        return surface
+
+
+resources = Resources()  # shared by the whole user interface
@@ -0,0 +1,115 @@
+import json
+import os
+import sys
+import time
+
+from map import *
+from simulation import Simulation
+from event_scheduler import Event_scheduler
+import map_io
+
+# Recording of game sessions, to replay them exactly, e.g. to reproduce a bug reported by a player, or as a performance test on a real game:
+#     python session_recording.py last_session.json
+# A game is fully determined by its map, the seed of the simulation and the inputs of the player, so that's all a recording holds:
+#     {"format": "trains-recording", "version": 1, "seed": 1234, "ticks_per_second": 40, "map": {...the map as in a map file...},
+#      "inputs": [[0, "edit", {"op": "station", "x": 3, "y": 5, "color": "#ff0000"}], [0, "start", null], [130, "edit", {"op": "toggle", "x": 2, "y": 1}], ...],
+#      "final": {"tick": 5000, "score_ok": 12, "score_nok": 3, "trains": [[tile_x, tile_y, distance, color, status], ...]}}
+# Each input is stamped with the simulation tick it came before: the editor operations (switch toggles included, see Map.record_edit), the game starts and stops.
+# The replay runs the simulation headlessly, the ticks in between the inputs in bulk (see Event_scheduler), and checks it ends in the recorded final state.
+RECORDING_FORMAT = "trains-recording"
+RECORDING_VERSION = 1
+
+
+def simulation_state(simulation:Simulation) -> dict:
+    """What a replay must end with: the tick, the scores, and where every train is and how it's doing."""
+    store, graph = simulation.train_store, simulation.track_graph
+    trains = []
+    for index in range(store.count):
+        element = graph.elements[store.node[index]]
+        trains.append([element.x // ELEMENT_SIZE, element.y // ELEMENT_SIZE, round(float(store.distance[index]), 6),
+                       map_io.color_to_hex(graph.colors[store.color[index]]), TRAIN_STATUSES[store.status[index]].name])
+    return {'tick': simulation.tick_count, 'score_ok': simulation.score_ok, 'score_nok': simulation.score_nok,
+            'status_counts': {status.name: int(count) for status, count in zip(TRAIN_STATUSES, store.status_counts)}, 'trains': trains}
+
+
+class Session_recorder:
+    # Records the game played on a simulation, from its last reset (a new map): start() is called then, and the inputs come as they happen.
+    # Recording costs a list entry per input, the recording is only written (with the final state) by save().
+    def __init__(self):
+        self.simulation = None
+        self.recording = None
+
+    def start(self, simulation:Simulation, map_data:dict=None):
+        """Record from now on, a new game having started on the simulation (with a new map, or the map loaded).
+        map_data: the map as plain data (see map_io.map_to_data), if already at hand."""
+        if self.simulation: self.simulation.map.remove_edit_listener(self.record_edit)
+        self.simulation = simulation
+        simulation.map.add_edit_listener(self.record_edit)
+        self.recording = {'format': RECORDING_FORMAT, 'version': RECORDING_VERSION, 'seed': simulation.seed, 'ticks_per_second': simulation.ticks_per_second,
+                          'map': map_data if map_data is not None else map_io.map_to_data(simulation.map), 'inputs': []}
+
+    def record(self, kind:str, content=None):
+        # kind: 'edit', 'start' or 'stop'
+        self.recording['inputs'].append([self.simulation.tick_count, kind, content])
+
+    def record_edit(self, edit:dict):
+        self.record('edit', edit)
+
+    def save(self, filename:str):
+        """Write the recording, up to now, with the current state of the simulation as the final state."""
+        temporary_filename = filename + '.tmp'
+        with open(temporary_filename, 'w') as f:
+            json.dump({**self.recording, 'final': simulation_state(self.simulation)}, f, default=map_io.color_to_hex, separators=(',', ':'))
+        os.replace(temporary_filename, filename)
+
+
+def load_recording(filename:str) -> dict:
+    with open(filename, 'r') as f:
+        recording = json.load(f)
+    if not isinstance(recording, dict) or recording.get('format') != RECORDING_FORMAT:
+        raise ValueError("Not a recording")
+    if recording.get('version', 0) > RECORDING_VERSION:
+        raise ValueError(f"Recording version {recording.get('version')} is not supported, please update the game")
+    return recording
+
+
+def replay(recording:dict) -> Simulation:
+    """Play the recorded game again, as fast as possible. Returns the simulation, as of the recorded final tick (or of the last input, without one)."""
+    map = map_io.map_from_data(recording['map'])
+    simulation = Simulation(map, ticks_per_second=recording['ticks_per_second'], seed=recording['seed'])
+    scheduler = Event_scheduler(simulation)
+    for tick, kind, content in recording['inputs']:
+        if tick > simulation.tick_count: scheduler.run(tick - simulation.tick_count)
+        if kind == 'edit': map.apply_edit(content)
+        elif kind == 'start': simulation.start()
+    if 'final' in recording and recording['final']['tick'] > simulation.tick_count:
+        scheduler.run(recording['final']['tick'] - simulation.tick_count)
+    return simulation
+
+
+def differences(recording:dict, simulation:Simulation) -> list:
+    """How the state of the replayed simulation differs from the recorded final state (an empty list if it doesn't)."""
+    expected, actual = recording['final'], simulation_state(simulation)
+    found = [f"{key}: recorded {expected[key]}, replayed {actual[key]}" for key in ('tick', 'score_ok', 'score_nok', 'status_counts') if expected[key] != actual[key]]
+    if len(expected['trains']) != len(actual['trains']):
+        found.append(f"trains: recorded {len(expected['trains'])}, replayed {len(actual['trains'])}")
+    for index, (expected_train, actual_train) in enumerate(zip(expected['trains'], actual['trains'])):
+        if expected_train != actual_train: found.append(f"train {index}: recorded {expected_train}, replayed {actual_train}")
+    return found
+
+
+if __name__ == "__main__":
+    # Replay and check recordings: python session_recording.py recording.json [other.json ...], exits with 1 if any replay doesn't match
+    configure_logging()
+    failed = False
+    for filename in sys.argv[1:]:
+        recording = load_recording(filename)
+        start = time.perf_counter()
+        simulation = replay(recording)
+        elapsed = time.perf_counter() - start
+        found = differences(recording, simulation)
+        print(f"{filename}: {simulation.tick_count} ticks replayed in {elapsed:.3f}s ({simulation.tick_count / max(elapsed, 1e-9):.0f} ticks/s), "
+              + ("matches the recording" if not found else f"{len(found)} differences:"))
+        for difference in found[:20]: print("    " + difference)
+        failed = failed or bool(found)
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,78 @@
+import random
+
+from map import *
+from track_graph import Track_graph
+
+
+class Simulation:
+    # The headless core of the game: it owns the map, the trains, the spawn timer and the scores, and advances them one tick at a time.
+    # Nothing in here opens a window, renders anything or polls for events, so it can be driven by Game for interactive play,
+    #     or run on its own for thousands of simulated games (e.g. when tuning maps).
+    # All the randomness (the train colors and spawn intervals) comes from the simulation's own random generator, seeded at each reset:
+    #     the same map, seed and inputs always give the same game (see session_recording).
+    def __init__(self, map=None, ticks_per_second=SIMULATION_TICK_RATE, seed:int=None):
+        self.ticks_per_second = ticks_per_second  # the spawn intervals are expressed in seconds, this converts them to ticks
+        self.track_graph = None
+        self.set_map(map if map is not None else Map(), seed=seed)
+
+    @property
+    def map(self): return self._map
+
+    @map.setter
+    def map(self, value): self.set_map(value)
+
+    def set_map(self, map:Map, track_graph:Track_graph=None, seed:int=None):
+        """A new map means a new game: the track graph is compiled for it (unless given, compiled beforehand) and the trains and scores start over."""
+        if self.track_graph: self.track_graph.detach()
+        self._map = map
+        self.track_graph = track_graph if track_graph is not None else Track_graph(map)
+        self.reset(seed)
+
+    def reset(self, seed:int=None):
+        """Start over on the same map: no trains, no scores (e.g. to play the map again, without compiling it again).
+        seed: of the random generator of the new game, a random one by default."""
+        self.seed = seed if seed is not None else random.randrange(2**32)
+        self.rng = random.Random(self.seed)
+        self.train_store = Train_store(self.track_graph)
+        self.time_to_next_train_spawn = 0
+        self.score_ok = 0
+        self.score_nok = 0
+        self.tick_count = 0
+
+    @property
+    def trains(self): return self.train_store.views
+
+    def start(self):
+        """Called when the game (re)starts running: recompiles the parts of the track graph edited meanwhile."""
+        self.track_graph.sync()
+
+    def toggle_switch(self, switch:Switch):
+        # The trains already on the switch continue on the newly active branch, at the same distance from its start.
+        self.map.toggle_switch(switch)
+
+    def update(self):
+        """Advance the simulation by one tick (1/SIMULATION_TICK_RATE seconds of game time)."""
+        self.track_graph.sync()  # picks up the switches toggled since the last tick
+        en_route_trains = self.train_store.count_status(Train_status.EN_ROUTE)
+
+        # Spawn new train if enough time has passed since last spawn and the map is not too loaded:
+        if self.time_to_next_train_spawn <= 0 and en_route_trains < MAX_TRAINS_EN_ROUTE:
+            self.train_store.spawn(color=self.rng.choice([station.color for station in self.map.stations]),
+                                   current_tile=self.map.base_station,
+                                   train_status=Train_status.EN_ROUTE, tick=self.tick_count)
+            self.time_to_next_train_spawn = self.rng.randint(3 * self.ticks_per_second, 10 * self.ticks_per_second)  # Convert seconds to ticks
+        else:
+            self.time_to_next_train_spawn -= 1 # nothing spawned, clock ticks 1 more frame
+
+        # Advance all existing trains at once and count resulted points, if any:
+        score_ok, score_nok = self.train_store.advance(self.tick_count)
+        self.score_ok += score_ok
+        self.score_nok += score_nok
+
+        self.tick_count += 1
+
+    def run(self, ticks:int):
+        """Advance the simulation by the given number of ticks, without any rendering."""
+        for _ in range(ticks):
+            self.update()
+        return self
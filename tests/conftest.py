@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the game modules are imported from the repository root, as when the game runs
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
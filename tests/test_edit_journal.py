@@ -0,0 +1,120 @@
+import os
+import pytest
+
+import edit_journal
+from edit_journal import Edit_journal, Autosave_failed
+from map import *
+import map_io
+
+
+@pytest.fixture
+def journal(tmp_path, monkeypatch):
+    # without the background thread (as in the browser), the queued records are processed when process() is called, so the test decides when
+    monkeypatch.setattr(edit_journal, 'THREADS_AVAILABLE', False)
+    return Edit_journal(str(tmp_path / 'autosave.json'), str(tmp_path / 'autosave.journal'), compact_every=5)
+
+
+def edit(journal:Edit_journal, operation, *args):
+    # one editor operation, journaled and flushed on its own, as when the game processes each frame's records
+    operation(*args)
+    journal.process(journal.drain())
+
+
+def recovered(journal:Edit_journal) -> Edit_journal:
+    # what the next start of the game finds, the game having crashed (the journal was never closed)
+    return Edit_journal(journal.snapshot_filename, journal.journal_filename)
+
+
+def test_compaction_waits_for_the_end_of_a_drag(journal):
+    map = Map()
+    journal.start(map)
+    journal.process(journal.drain())
+    edit(journal, map.set_click_location, 0, 0)
+    edit(journal, map.add_base_station)
+    edit(journal, map.set_click_location, 0, 1)
+    edit(journal, map.add_track_by_click)
+    for tile_y in range(2, 9):  # compact_every is reached in the middle of the drag
+        edit(journal, map.add_track_drag, 0, tile_y)
+        assert journal.sequence - journal.edits_since_snapshot <= 2  # no snapshot since the drag started
+    edit(journal, map.finish_track_drag)
+    assert journal.edits_since_snapshot == 0  # compacted once the drag ended
+
+    restarted = recovered(journal)
+    recovered_map = restarted.recover()
+    assert restarted.recovery_errors == []
+    assert map_io.map_to_data(recovered_map) == map_io.map_to_data(map)
+    assert len(recovered_map.map_elements) == 9
+
+
+def test_crash_in_the_middle_of_a_drag(journal):
+    map = Map()
+    journal.start(map)
+    journal.process(journal.drain())
+    edit(journal, map.set_click_location, 3, 3)
+    edit(journal, map.add_track_by_click)
+    for tile_x in range(4, 10):
+        edit(journal, map.add_track_drag, tile_x, 3)
+
+    restarted = recovered(journal)
+    recovered_map = restarted.recover()
+    assert restarted.recovery_errors == []
+    assert map_io.map_to_data(recovered_map) == map_io.map_to_data(map)
+
+
+def test_nothing_is_restored_after_a_normal_exit(journal):
+    map = Map()
+    journal.start(map)
+    edit(journal, map.set_click_location, 0, 0)
+    edit(journal, map.add_base_station)
+    journal.close()
+    assert recovered(journal).recover() is None
+
+
+def test_edits_which_cant_be_replayed_are_reported(journal):
+    map = Map()
+    journal.start(map)
+    journal.process(journal.drain())
+    edit(journal, map.set_click_location, 0, 0)
+    edit(journal, map.add_base_station)
+    with open(journal.journal_filename, 'a') as f:
+        f.write('{"seq":99,"op":"drag","x":1,"y":0}\n')  # a drag which never started
+
+    restarted = recovered(journal)
+    recovered_map = restarted.recover()
+    assert len(restarted.recovery_errors) == 1
+    assert len(recovered_map.map_elements) == 1
+
+
+def failing_autosave(journal, monkeypatch) -> Map:
+    # a map with a base station autosaved, then a track which the autosave fails to take (e.g. a bug in replaying the edit)
+    map = Map()
+    journal.start(map)
+    journal.process(journal.drain())
+    edit(journal, map.set_click_location, 0, 0)
+    edit(journal, map.add_base_station)
+    def broken_apply_edit(self, record): raise OSError("broken")
+    monkeypatch.setattr(Map, 'apply_edit', broken_apply_edit)
+    edit(journal, map.set_click_location, 0, 1)
+    edit(journal, map.add_track_by_click)
+    monkeypatch.undo()
+    assert journal.failed
+    return map
+
+
+def test_no_save_from_a_failed_autosave(journal, tmp_path, monkeypatch):
+    failing_autosave(journal, monkeypatch)
+    future = journal.save_copy(str(tmp_path / 'saved.json'))
+    journal.process(journal.drain())
+    with pytest.raises(Autosave_failed):
+        future.result()
+    assert not os.path.exists(tmp_path / 'saved.json')
+
+
+def test_recovery_after_a_failed_autosave(journal, monkeypatch):
+    failing_autosave(journal, monkeypatch)
+    restarted = recovered(journal)
+    recovered_map = restarted.recover()
+    # the map as of the last edit autosaved: the edit which failed was not journaled, so there is nothing half applied to replay
+    assert restarted.recovery_errors == []
+    assert len(recovered_map.map_elements) == 1
+    assert recovered_map.base_station is not None
@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+from event_scheduler import Event_scheduler
+from map import *
+from map_generator import generate_map
+from simulation import Simulation
+
+TICKS = 3000
+TOGGLES = {tick: number for number, tick in enumerate(range(100, TICKS, 97))}  # tick -> number of the switch toggled just before it (cycling through them)
+
+
+def play(map_seed:int, event_driven:bool) -> Simulation:
+    simulation = Simulation(generate_map(8, 8, stations=6, seed=map_seed), seed=map_seed)
+    simulation.start()
+    switches = [element for element in simulation.map.map_elements.values() if isinstance(element, Switch)]
+    if event_driven:
+        scheduler = Event_scheduler(simulation)
+        for tick, switch in TOGGLES.items(): scheduler.schedule_toggle(tick, switches[switch % len(switches)])
+        scheduler.run(TICKS)
+    else:
+        for tick in range(TICKS):
+            if tick in TOGGLES: simulation.toggle_switch(switches[TOGGLES[tick] % len(switches)])
+            simulation.update()
+    return simulation
+
+
+@pytest.mark.parametrize('map_seed', range(5))
+def test_events_give_the_same_game_as_ticks(map_seed):
+    stepped, evented = play(map_seed, event_driven=False), play(map_seed, event_driven=True)
+    assert stepped.score_ok + stepped.score_nok > 0  # trains did arrive, the game is not trivial
+    assert (evented.tick_count, evented.score_ok, evented.score_nok) == (stepped.tick_count, stepped.score_ok, stepped.score_nok)
+    stepped_store, evented_store = stepped.train_store, evented.train_store
+    assert evented_store.count == stepped_store.count
+    for name in ('node', 'distance', 'color', 'status'):
+        assert np.array_equal(getattr(evented_store, name)[:evented_store.count], getattr(stepped_store, name)[:stepped_store.count]), name
+    assert np.array_equal(evented_store.status_counts, stepped_store.status_counts)
@@ -0,0 +1,31 @@
+import os
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')  # no window
+import pytest
+
+from edit_journal import Edit_journal
+from game import Game
+from map import *
+import map_io
+
+
+@pytest.fixture
+def game(tmp_path):
+    game = Game(journal=Edit_journal(str(tmp_path / 'autosave.json'), str(tmp_path / 'autosave.journal')), seed=1)
+    yield game
+    game.journal.close()
+
+
+def test_save_writes_the_map_even_if_the_autosave_failed(game, tmp_path, monkeypatch):
+    def broken_apply_edit(self, record): raise OSError("broken")
+    monkeypatch.setattr(Map, 'apply_edit', broken_apply_edit)  # the autosave's copy of the map stops following the edits
+    game.map.set_click_location(2, 3)
+    game.map.add_base_station()
+    game.map.set_click_location(2, 4)
+    game.map.add_track_by_click()
+    game.map.finish_track_drag()
+
+    filename = str(tmp_path / 'saved.json')
+    game.save_map(filename)
+    assert game.journal.failed
+    assert game.popup_message == f"Map saved successfully as {filename}."
+    assert map_io.read_map_data(filename) == map_io.map_to_data(game.map)
@@ -0,0 +1,31 @@
+import pytest
+
+from game_utils import Utils
+
+
+@pytest.mark.parametrize('start, end, expected', [
+    ((2, 2), (2, 2), [(2, 2)]),  # zero length
+    ((0, 0), (3, 0), [(0, 0), (1, 0), (2, 0), (3, 0)]),  # axis-aligned
+    ((3, 1), (0, 1), [(3, 1), (2, 1), (1, 1), (0, 1)]),
+    ((0, 0), (0, 3), [(0, 0), (0, 1), (0, 2), (0, 3)]),
+    ((0, 3), (0, 0), [(0, 3), (0, 2), (0, 1), (0, 0)]),
+    # exact diagonals, through the tile corners: the tile along x is taken first
+    ((0, 0), (2, 2), [(0, 0), (1, 0), (1, 1), (2, 1), (2, 2)]),
+    ((2, 2), (0, 0), [(2, 2), (1, 2), (1, 1), (0, 1), (0, 0)]),
+    ((0, 0), (2, -2), [(0, 0), (1, 0), (1, -1), (2, -1), (2, -2)]),
+    ((0, 0), (-2, 2), [(0, 0), (-1, 0), (-1, 1), (-2, 1), (-2, 2)]),
+    # shallow and steep lines
+    ((0, 0), (4, 1), [(0, 0), (1, 0), (2, 0), (2, 1), (3, 1), (4, 1)]),
+    ((0, 0), (1, -4), [(0, 0), (0, -1), (0, -2), (1, -2), (1, -3), (1, -4)]),
+])
+def test_grid_line(start, end, expected):
+    assert list(Utils.grid_line(*start, *end)) == expected
+
+
+@pytest.mark.parametrize('end', [(x, y) for x in range(-5, 6) for y in range(-5, 6)])
+def test_grid_line_goes_side_by_side(end):
+    tiles = list(Utils.grid_line(0, 0, *end))
+    assert tiles[0] == (0, 0) and tiles[-1] == end
+    assert len(tiles) == abs(end[0]) + abs(end[1]) + 1  # every tile once, no detour
+    for (x1, y1), (x2, y2) in zip(tiles, tiles[1:]):
+        assert abs(x2 - x1) + abs(y2 - y1) == 1  # never diagonally
@@ -0,0 +1,77 @@
+import os
+import pickle
+import pytest
+
+from map import *
+import map_io
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def small_map() -> Map:
+    # a base station, a track turning down to a switch, and a station on each of its branches
+    map = Map(6, 6)
+    map.set_click_location(0, 0)
+    map.add_base_station()
+    map.set_click_location(1, 0)
+    map.add_track_by_click()
+    map.add_track_drag(3, 0)
+    map.add_track_drag(3, 2)
+    map.finish_track_drag()
+    map.set_click_location(3, 3)
+    map.add_switch()
+    map.set_click_location(3, 4)
+    map.add_station(pygame.Color('red'))
+    map.set_click_location(4, 3)
+    map.add_station(pygame.Color('blue'))
+    return map
+
+
+def by_tile(data:dict) -> dict:
+    return {**data, 'tiles': sorted(data['tiles'], key=lambda record: (record['x'], record['y']))}
+
+
+def test_round_trip(tmp_path):
+    map = small_map()
+    filename = str(tmp_path / 'map.json')
+    map_io.save_map(map, filename)
+    loaded = map_io.load_map(filename)
+    assert map_io.map_to_data(loaded) == map_io.map_to_data(map)
+    # the links are rebuilt: the chain goes from the base station through the switch to a station
+    element, seen = loaded.base_station, []
+    while element is not None:
+        seen.append(type(element).__name__)
+        element = element.next_segment
+    assert seen[0] == 'Base_station' and 'Switch' in seen and seen[-1] == 'Station'
+    switch = loaded.map_elements[3, 3]
+    assert isinstance(switch.next_segment_inactive, Station)
+    assert [tuple(station.color) for station in loaded.stations] == [tuple(station.color) for station in map.stations]
+
+
+def test_newer_versions_are_refused(tmp_path):
+    data = map_io.map_to_data(small_map())
+    with pytest.raises(ValueError):
+        map_io.map_from_data({**data, 'version': map_io.MAP_FILE_VERSION + 1})
+    with pytest.raises(ValueError):
+        map_io.map_from_data({**data, 'format': 'something else'})
+
+
+def test_legacy_pickle_migration():
+    migrated = map_io.read_map_data(os.path.join(REPOSITORY, 'Map_lumosity_1.pkl'))
+    saved = map_io.read_map_data(os.path.join(REPOSITORY, 'Map_lumosity_1.json'))
+    assert by_tile(migrated) == by_tile(saved)
+    map_io.map_from_data(migrated)  # and it's a valid map
+
+
+class Exploit:
+    def __init__(self, marker): self.marker = marker
+    def __reduce__(self): return (os.system, (f'echo hacked > "{self.marker}"',))
+
+
+def test_legacy_pickle_refuses_other_globals(tmp_path):
+    marker = tmp_path / 'hacked'
+    filename = tmp_path / 'map.pkl'
+    filename.write_bytes(pickle.dumps(Exploit(str(marker)), protocol=2))
+    with pytest.raises(pickle.UnpicklingError, match='os'):
+        map_io.read_map_data(str(filename))
+    assert not marker.exists()
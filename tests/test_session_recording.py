@@ -0,0 +1,44 @@
+import os
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')  # no window
+import random
+import pytest
+
+from edit_journal import Edit_journal
+from game import Game
+from map import *
+from map_generator import generate_map
+import session_recording
+
+
+@pytest.fixture
+def recording(tmp_path) -> dict:
+    # a short game played through the Game, as a player would: switches toggled now and then, frames of all durations, fast-forwarding for a while
+    game = Game(journal=Edit_journal(str(tmp_path / 'autosave.json'), str(tmp_path / 'autosave.journal')), seed=7)
+    game.map = generate_map(8, 8, stations=6, seed=3)
+    game.popup_active = False
+    game.start_game()
+    rng = random.Random(5)
+    switches = [element for element in game.map.map_elements.values() if isinstance(element, Switch)]
+    for frame in range(400):
+        if frame == 150: game.speed = 10
+        if frame == 250: game.speed = 1
+        if rng.random() < 0.1: game.map.toggle_switch(rng.choice(switches))
+        game.advance(rng.choice((0.008, 0.016, 0.017, 0.033, 0.1, 0.3)))
+    filename = str(tmp_path / 'session.json')
+    game.recorder.save(filename)
+    game.journal.close()
+    assert game.score_ok + game.score_nok > 0  # trains did arrive, the game is not trivial
+    return session_recording.load_recording(filename)
+
+
+def test_replay_reproduces_the_session(recording):
+    assert sum(1 for _, kind, content in recording['inputs'] if kind == 'edit' and content['op'] == 'toggle') > 10
+    simulation = session_recording.replay(recording)
+    assert session_recording.differences(recording, simulation) == []
+    assert simulation.tick_count == recording['final']['tick']
+
+
+def test_replay_without_the_toggles_differs(recording):
+    recording['inputs'] = [input for input in recording['inputs'] if not (input[1] == 'edit' and input[2]['op'] == 'toggle')]
+    simulation = session_recording.replay(recording)
+    assert session_recording.differences(recording, simulation) != []
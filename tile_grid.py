@@ -0,0 +1,87 @@
+CHUNK_SIZE = 32  # tiles per chunk side
+
+
+class Tile_grid:
+    # Sparse storage of the map elements, by tile coordinates.
+    # The tiles are grouped in square chunks, kept in a dict by chunk coordinates, and only the chunks which have at least one element exist.
+    # So a huge map costs memory (and iteration time) in proportion to its elements, not to its area,
+    #     while reading or writing a tile stays O(1): a dict lookup for the chunk plus a list index inside it.
+    def __init__(self, width:int, height:int, chunk_size:int=CHUNK_SIZE):
+        self.width = width
+        self.height = height
+        self.chunk_size = chunk_size
+        self.chunks = {}  # (chunk_x, chunk_y) -> flat list of chunk_size*chunk_size elements (None for empty tiles)
+        self.chunk_counts = {}  # (chunk_x, chunk_y) -> number of elements in the chunk, to drop the chunks which become empty
+        self.count = 0
+
+    def __len__(self): return self.count
+
+    def in_bounds(self, tile_x:int, tile_y:int) -> bool:
+        return 0 <= tile_x < self.width and 0 <= tile_y < self.height
+
+    def get(self, tile_x:int, tile_y:int):
+        """The element on the tile, None for empty tiles and for tiles outside the map."""
+        chunk = self.chunks.get((tile_x // self.chunk_size, tile_y // self.chunk_size))
+        if chunk is None or not self.in_bounds(tile_x, tile_y): return None
+        return chunk[(tile_y % self.chunk_size) * self.chunk_size + tile_x % self.chunk_size]
+
+    def set(self, tile_x:int, tile_y:int, element):
+        """Put the element on the tile, or clear the tile if element is None."""
+        if not self.in_bounds(tile_x, tile_y):
+            raise IndexError(f"Tile ({tile_x}, {tile_y}) is outside the {self.width}x{self.height} map")
+        chunk_key = (tile_x // self.chunk_size, tile_y // self.chunk_size)
+        chunk = self.chunks.get(chunk_key)
+        if chunk is None:
+            if element is None: return  # nothing to clear
+            chunk = self.chunks[chunk_key] = [None] * (self.chunk_size * self.chunk_size)
+            self.chunk_counts[chunk_key] = 0
+        index = (tile_y % self.chunk_size) * self.chunk_size + tile_x % self.chunk_size
+        change = (element is not None) - (chunk[index] is not None)
+        chunk[index] = element
+        self.count += change
+        self.chunk_counts[chunk_key] += change
+        if self.chunk_counts[chunk_key] == 0:
+            del self.chunks[chunk_key]
+            del self.chunk_counts[chunk_key]
+
+    def __getitem__(self, tile): return self.get(*tile)
+
+    def __setitem__(self, tile, element): self.set(*tile, element)
+
+    def items(self):
+        """(tile_x, tile_y, element) for the occupied tiles only."""
+        for (chunk_x, chunk_y), chunk in self.chunks.items():
+            for index, element in enumerate(chunk):
+                if element is not None:
+                    yield chunk_x * self.chunk_size + index % self.chunk_size, chunk_y * self.chunk_size + index // self.chunk_size, element
+
+    def values(self):
+        """The elements of the map, skipping the empty tiles."""
+        for chunk in self.chunks.values():
+            for element in chunk:
+                if element is not None: yield element
+
+    def items_in(self, tiles_x:range, tiles_y:range):
+        """(tile_x, tile_y, element) for the occupied tiles of the given area, visiting only the chunks which exist.
+        The chunks are visited row by row, and the tiles in each chunk too, so the upper and left neighbors of a tile always come before it."""
+        size = self.chunk_size
+        if not tiles_x or not tiles_y: return
+        for chunk_y in range(tiles_y.start // size, (tiles_y.stop - 1) // size + 1):
+            for chunk_x in range(tiles_x.start // size, (tiles_x.stop - 1) // size + 1):
+                chunk = self.chunks.get((chunk_x, chunk_y))
+                if chunk is None: continue
+                x_from, x_to = max(tiles_x.start, chunk_x * size), min(tiles_x.stop, (chunk_x + 1) * size)
+                for tile_y in range(max(tiles_y.start, chunk_y * size), min(tiles_y.stop, (chunk_y + 1) * size)):
+                    row_start = (tile_y - chunk_y * size) * size - chunk_x * size
+                    for tile_x in range(x_from, x_to):
+                        element = chunk[row_start + tile_x]
+                        if element is not None: yield tile_x, tile_y, element
+
+    @classmethod
+    def from_columns(cls, columns:list):
+        """Converts the dense list of columns (indexed [x][y]) used by the maps saved with older versions."""
+        grid = cls(len(columns), len(columns[0]) if columns else 0)
+        for tile_x, column in enumerate(columns):
+            for tile_y, element in enumerate(column):
+                if element is not None: grid.set(tile_x, tile_y, element)
+        return grid
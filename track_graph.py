@@ -0,0 +1,110 @@
+import math
+import numpy as np
+
+from map import *
+
+NO_NODE = -1  # successor value for unconnected ends
+
+
+class Track_graph:
+    # A flat, compiled version of the map, for fast simulation: every element gets an integer node id, and per node we keep in arrays
+    #     its successor(s), the segment travelled by trains over it (a polyline from its start point, along its movement versor) and the length of that segment.
+    # Switches are two-way branch nodes: successor is the currently active branch, successor_inactive the other one.
+    # A train then only needs (node id, distance travelled along the node): moving is an addition, and only at the end of a segment we look up the successor.
+    # The graph listens to the map changes and recompiles only the nodes of the changed tiles (on the next sync()), so switch toggles and editor actions stay cheap.
+    def __init__(self, map:Map):
+        self.map = map
+        self.elements = []  # node id -> Map_element
+        self.ids = {}  # Map_element -> node id
+        capacity = 64
+        self.start_x = np.zeros(capacity)  # where a train entering the node is placed
+        self.start_y = np.zeros(capacity)
+        self.dir_x = np.zeros(capacity)  # movement versor of the node
+        self.dir_y = np.zeros(capacity)
+        self.length = np.zeros(capacity)  # distance travelled on the node before moving on to the successor
+        self.successor = np.full(capacity, NO_NODE, dtype=np.int32)
+        self.successor_inactive = np.full(capacity, NO_NODE, dtype=np.int32)  # only used by switches
+        self.station_color = np.full(capacity, -1, dtype=np.int16)  # index in self.colors for stations, -1 for other elements
+        # colors palette, shared with the trains, so that arriving in the home station is a simple integer comparison:
+        self.colors = []
+        self.color_ids = {}
+        self.dirty_tiles = set()
+        self.pending = []  # nodes allocated but not compiled yet
+        # compile the whole map once, in a single pass over the occupied tiles:
+        for element in map.map_elements.values():
+            self.node_id(element)
+        self.sync()
+        map.add_change_listener(self.invalidate)
+
+    def __len__(self): return len(self.elements)
+
+    def detach(self):
+        """Stop following the map changes (when the graph is dropped)."""
+        self.map.remove_change_listener(self.invalidate)
+
+    def invalidate(self, tile_x, tile_y):
+        self.dirty_tiles.add((tile_x, tile_y))
+
+    def color_id(self, color) -> int:
+        color_id = self.color_ids.get(tuple(color))
+        if color_id is None:
+            color_id = self.color_ids[tuple(color)] = len(self.colors)
+            self.colors.append(color)
+        return color_id
+
+    def node_id(self, element) -> int:
+        node = self.ids.get(element)
+        if node is None:
+            node = len(self.elements)
+            self.elements.append(element)
+            self.ids[element] = node
+            for name in ('start_x', 'start_y', 'dir_x', 'dir_y', 'length', 'successor', 'successor_inactive', 'station_color'):
+                fill = NO_NODE if name.startswith('successor') else (-1 if name == 'station_color' else 0)
+                setattr(self, name, Utils.grow(getattr(self, name), node + 1, fill))
+            self.pending.append(node)  # compiled iteratively in sync(), so that long chains don't recurse
+        return node
+
+    def sync(self):
+        """Recompile the nodes changed since the last sync. Cheap when nothing changed, so it can be called every tick."""
+        if self.dirty_tiles:
+            for tile_x, tile_y in self.dirty_tiles:
+                element = self.map.map_elements[tile_x, tile_y]
+                if element is not None: self.pending.append(self.node_id(element))
+            self.dirty_tiles.clear()
+        while self.pending:
+            self.compile_node(self.pending.pop())
+
+    def compile_node(self, node):
+        element = self.elements[node]
+        # Trains spawn at the center of the base station, on other elements they enter at end1:
+        if isinstance(element, Base_station) or element.end1_coordinates[0] is None:
+            start_x, start_y = element.x, element.y
+        else:
+            start_x, start_y = element.end1_coordinates
+        self.start_x[node] = start_x
+        self.start_y[node] = start_y
+        self.dir_x[node] = element.versor_x
+        self.dir_y[node] = element.versor_y
+        # A train moves by whole TRAIN_SPEED steps and stops stepping when a further step would take it beyond end2 (on either axis),
+        #     so the length is the number of whole steps which fit between start and end2:
+        end2_x, end2_y = element.end2_coordinates
+        steps = 0
+        if end2_x is not None:
+            steps = math.inf
+            for start, end, step in ((start_x, end2_x, element.versor_x * TRAIN_SPEED), (start_y, end2_y, element.versor_y * TRAIN_SPEED)):
+                if step != 0: steps = min(steps, math.floor(abs(end - start) / abs(step)))
+            if steps == math.inf: steps = 0  # zero versor, the train can't move
+        self.length[node] = steps * TRAIN_SPEED
+        self.successor[node] = self.node_id(element.next_segment) if element.next_segment else NO_NODE
+        next_inactive = getattr(element, 'next_segment_inactive', None)
+        self.successor_inactive[node] = self.node_id(next_inactive) if next_inactive else NO_NODE
+        self.station_color[node] = self.color_id(element.color) if isinstance(element, Station) else -1
+
+    def is_stalled(self, nodes):
+        """Nodes on which trains can't move at all (zero movement versor, e.g. an unconnected base station)."""
+        return (self.dir_x[nodes] == 0) & (self.dir_y[nodes] == 0)
+
+    def positions(self, nodes, distances):
+        """Pixel coordinates of points at the given distances along the given nodes (vectorized)."""
+        return (self.start_x[nodes] + self.dir_x[nodes] * distances,
+                self.start_y[nodes] + self.dir_y[nodes] * distances)